@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare copying a committed ``NamedBlobFile`` through Python with
+``shutil.copyfileobj``, as the copy hook used to, and with
+``BlobFileCopyHook``.
+
+Usage::
+
+    python benchmarks/bench_blob_copy.py [size in MB]
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import transaction
+
+from ZODB import DB
+
+from ZODB.blob import Blob
+from ZODB.blob import BlobStorage
+
+from ZODB.MappingStorage import MappingStorage
+
+from zope.configuration import xmlconfig
+
+from zope.copy import copy
+
+import plone.namedfile
+
+from plone.namedfile.copy import BlobFileCopyHook
+
+from plone.namedfile.file import NamedBlobFile
+
+
+def legacy_copy_blob(self, translate):
+    # pylint: disable=W0212
+    target = translate(self.context)
+    target._blob = Blob()
+    fsrc = self.context._blob.open('r')
+    fdst = target._blob.open('w')
+    shutil.copyfileobj(fsrc, fdst)
+    fdst.close()
+    fsrc.close()
+
+
+def run(conn, source):
+    start = time.time()
+    target = copy(source)
+    conn.root()['target'] = target
+    transaction.commit()
+    elapsed = time.time() - start
+    del conn.root()['target']
+    transaction.commit()
+    return elapsed
+
+
+def main(args):
+    size = int(args[0]) if args else 1024
+    xmlconfig.file('configure.zcml', plone.namedfile)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        conn = db.open()
+        source = NamedBlobFile()
+        with source.open('w') as fp:
+            chunk = os.urandom(1 << 20)
+            for _ in range(size):
+                fp.write(chunk)
+        conn.root()['source'] = source
+        transaction.commit()
+
+        copy_blob = BlobFileCopyHook._copyBlob
+        BlobFileCopyHook._copyBlob = legacy_copy_blob
+        print('%-12s %10.3f' % ('copyfileobj', run(conn, source)))
+        BlobFileCopyHook._copyBlob = copy_blob
+        print('%-12s %10.3f' % ('copy hook', run(conn, source)))
+        BlobFileCopyHook.share_blobs = True
+        print('%-12s %10.3f' % ('share', run(conn, source)))
+        conn.close()
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
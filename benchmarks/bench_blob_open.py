@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Count the blob files opened, and the time taken, to build a
+``NamedBlobImage``.
+
+Usage::
+
+    python benchmarks/bench_blob_open.py [iterations]
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import io
+import sys
+import time
+
+import piexif
+
+from PIL import Image
+
+from ZODB.blob import Blob
+
+from zope.configuration import xmlconfig
+
+import plone.namedfile
+
+from plone.namedfile.file import EXIF_FULL
+from plone.namedfile.file import NamedBlobImage
+from plone.namedfile.file import ORIENTATION_RECORD
+
+
+OPENS = []
+
+
+def counting_open(blob, mode='r', _open=Blob.open):
+    OPENS.append(mode)
+    return _open(blob, mode)
+
+
+class RecordingBlobImage(NamedBlobImage):
+    orientation_mode = ORIENTATION_RECORD
+
+
+class FullExifBlobImage(NamedBlobImage):
+    exif_storage = EXIF_FULL
+
+
+def make_jpeg(orientation=None):
+    out = io.BytesIO()
+    img = Image.new('RGB', (1024, 768), (200, 100, 50))
+    img.save(out, format='JPEG')
+    data = out.getvalue()
+    if orientation:
+        exif = {'0th': {piexif.ImageIFD.Orientation: orientation}}
+        out = io.BytesIO()
+        piexif.insert(piexif.dump(exif), data, out)
+        data = out.getvalue()
+    return data
+
+
+def main(args):
+    number = int(args[0]) if args else 1000
+    xmlconfig.file('configure.zcml', plone.namedfile)
+    Blob.open = counting_open
+    cases = (
+        ('jpeg', NamedBlobImage, make_jpeg()),
+        ('jpeg+exif', FullExifBlobImage, make_jpeg(1)),
+        ('jpeg+orientation', RecordingBlobImage, make_jpeg(6)),
+    )
+    print('%-18s %12s %12s' % ('image', 'opens/image', 'usec/image'))
+    for name, factory, data in cases:
+        del OPENS[:]
+        start = time.time()
+        for _ in range(number):
+            factory(data, filename=u'image')
+        elapsed = time.time() - start
+        print('%-18s %12.1f %12.1f' % (name, len(OPENS) / number,
+                                       elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
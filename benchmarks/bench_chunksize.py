@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the commit time and the number of storage records of a
+``NamedFile`` stored with different chunk sizes.
+
+Usage::
+
+    python benchmarks/bench_chunksize.py [size in MB]
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import transaction
+
+from ZODB import DB
+
+from ZODB.FileStorage import FileStorage
+
+from plone.namedfile.file import NamedFile
+from plone.namedfile.file import MAXCHUNKSIZE
+
+
+def run(data, chunk_size, adaptive):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        storage = FileStorage(os.path.join(tmpdir, 'Data.fs'))
+        db = DB(storage)
+        conn = db.open()
+        try:
+            records = len(storage)
+            start = time.time()
+            source = NamedFile()
+            conn.root()['file'] = source
+            source._setData(io.BytesIO(data),
+                            chunk_size=chunk_size,
+                            adaptive=adaptive)
+            transaction.commit()
+            elapsed = time.time() - start
+            records = len(storage) - records
+        finally:
+            conn.close()
+            db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    return elapsed, records
+
+
+def main(args):
+    size = int(args[0]) if args else 100
+    data = os.urandom(1 << 20) * size
+    print('%-12s %10s %10s' % ('chunk size', 'seconds', 'records'))
+    for chunk_size in (MAXCHUNKSIZE, 1 << 18, 1 << 20, 1 << 22):
+        elapsed, records = run(data, chunk_size, False)
+        print('%-12s %10.3f %10d' % (chunk_size, elapsed, records))
+    elapsed, records = run(data, MAXCHUNKSIZE, True)
+    print('%-12s %10.3f %10d' % ('adaptive', elapsed, records))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare ``mimetypes.guess_type`` with ``get_contenttype`` on the file
+names of a bulk import.
+
+Usage::
+
+    python benchmarks/bench_contenttype.py [number of files]
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import time
+import mimetypes
+
+from plone.namedfile.utils import get_contenttype
+from plone.namedfile.utils import warm_contenttypes
+
+EXTENSIONS = ('.pdf', '.docx', '.JPG', '.png', '.txt', '.tar.gz', '.mp4',
+              '.html', '.csv', '')
+
+
+def filenames(number):
+    return [u'upload-%d%s' % (i, EXTENSIONS[i % len(EXTENSIONS)])
+            for i in range(number)]
+
+
+def main(args):
+    number = int(args[0]) if args else 300000
+    names = filenames(number)
+
+    start = time.time()
+    warm_contenttypes()
+    print('%-16s %10.3f' % ('warm', time.time() - start))
+
+    start = time.time()
+    for name in names:
+        mimetypes.guess_type(name, strict=True)
+    print('%-16s %10.3f' % ('guess_type', time.time() - start))
+
+    start = time.time()
+    for name in names:
+        get_contenttype(filename=name)
+    print('%-16s %10.3f' % ('get_contenttype', time.time() - start))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
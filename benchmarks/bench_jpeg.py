@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro benchmark of the JPEG header scanner on baseline and progressive
+images, with and without a large EXIF segment.
+
+Usage::
+
+    python benchmarks/bench_jpeg.py [iterations]
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import struct
+import timeit
+from io import BytesIO
+
+from PIL import Image
+
+from plone.namedfile.utils.jpeg_utils import process_jpeg
+from plone.namedfile.utils.jpeg_utils import process_jpeg_file
+
+
+def legacy_process_jpeg(data):
+    """
+    The byte by byte scanner ``process_jpeg`` used to be
+    """
+    size = len(data)
+    content_type, width, height = None, -1, -1
+    if size >= 2 and data.startswith(b'\377\330'):
+        content_type = 'image/jpeg'
+        jpeg = BytesIO(data)
+        jpeg.read(2)
+        b = jpeg.read(1)
+        try:
+            while b and ord(b) != 0xDA:
+                while ord(b) != 0xFF:
+                    b = jpeg.read(1)
+                while ord(b) == 0xFF:
+                    b = jpeg.read(1)
+                if ord(b) >= 0xC0 and ord(b) <= 0xC3:
+                    jpeg.read(3)
+                    height, width = struct.unpack(b'>HH', jpeg.read(4))
+                    break
+                else:
+                    jpeg.read(int(struct.unpack(b'>H', jpeg.read(2))[0]) - 2)
+                b = jpeg.read(1)
+            width = int(width)
+            height = int(height)
+        except (struct.error, ValueError, TypeError):
+            pass
+    return content_type, width, height
+
+
+def make_jpeg(progressive=False, app_segments=0):
+    out = BytesIO()
+    img = Image.new('RGB', (1024, 768), (200, 100, 50))
+    img.save(out, format='JPEG', progressive=progressive)
+    data = out.getvalue()
+    # large APPn segments, like EXIF data with thumbnails and maker notes
+    segment = b'\xff\xe1' + struct.pack('>H', 0xFFFF) + b'\x00' * 0xFFFD
+    return data[:2] + segment * app_segments + data[2:]
+
+
+def main(args):
+    number = int(args[0]) if args else 10000
+    images = (
+        ('baseline', make_jpeg()),
+        ('progressive', make_jpeg(progressive=True)),
+        ('baseline+exif', make_jpeg(app_segments=4)),
+        ('progressive+exif', make_jpeg(progressive=True, app_segments=4)),
+    )
+    functions = (
+        ('legacy', legacy_process_jpeg),
+        ('process_jpeg', process_jpeg),
+        ('process_jpeg_file', lambda data: process_jpeg_file(BytesIO(data))),
+    )
+    print('%-18s %-18s %12s  %s' % ('image', 'scanner', 'usec/call', 'result'))
+    for image_name, data in images:
+        for func_name, func in functions:
+            elapsed = timeit.timeit(lambda: func(data), number=number)
+            print('%-18s %-18s %12.2f  %s' % (image_name, func_name,
+                                             elapsed / number * 1e6,
+                                             func(data)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -53,11 +53,13 @@ setup(
     namespace_packages=['plone'],
     install_requires=[
         'setuptools',
+        'BTrees',
+        'futures; python_version == "2.7"',
         'piexif',
         'Pillow',
         'persistent',
         'six',
-        'transaction',
+        'transaction >= 3.0',
         'ZODB',
         'zope.component',
         'zope.copy',
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A content addressed store deduplicating the blobs of blob files.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
+
+from persistent import Persistent
+
+from zope.interface import implementer
+
+from plone.namedfile.interfaces import IBlobStore
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@implementer(IBlobStore)
+class ContentAddressedBlobStore(Persistent):
+    """
+    Keeps a blob per digest of its data, with the number of blob files
+    referencing it.
+
+    Registered as the `IBlobStore` utility, `NamedBlobFile` objects with
+    the same data share the same blob.
+    """
+
+    #: The `hashlib` algorithm of the digests
+    algorithm = 'sha256'
+
+    def __init__(self, algorithm=None):
+        if algorithm:
+            self.algorithm = algorithm
+        self.blobs = OOBTree()
+        self.refcounts = OIBTree()
+
+    def __len__(self):
+        return len(self.blobs)
+
+    def __contains__(self, digest):
+        return digest in self.blobs
+
+    def add(self, digest, blob):
+        stored = self.blobs.get(digest)
+        if stored is None:
+            stored = self.blobs[digest] = blob
+        self.refcounts[digest] = self.refcounts.get(digest, 0) + 1
+        return stored
+
+    def get(self, digest, default=None):
+        return self.blobs.get(digest, default)
+
+    def release(self, digest):
+        refcount = self.refcounts.get(digest, 0) - 1
+        if refcount > 0:
+            self.refcounts[digest] = refcount
+        elif digest in self.blobs:
+            del self.blobs[digest]
+            del self.refcounts[digest]
+
+    def sweep(self, digests):
+        refcounts = {}
+        for digest in digests:
+            if digest in self.blobs:
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+        removed = 0
+        for digest in list(self.blobs.keys()):
+            refcount = refcounts.get(digest)
+            if refcount:
+                if self.refcounts.get(digest) != refcount:
+                    self.refcounts[digest] = refcount
+            else:
+                del self.blobs[digest]
+                self.refcounts.pop(digest, None)
+                removed += 1
+        logger.info('Removed %s unreferenced blobs', removed)
+        return removed
@@ -13,19 +13,123 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
-import shutil
+import os
+import sys
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+import transaction
 
 from ZODB.blob import Blob
+from ZODB.blob import BlobError
 
 from zope.component import adapter
+from zope.component import queryUtility
 
 from zope.copy.interfaces import ICopyHook
 from zope.copy.interfaces import ResumeCopy
 
 from zope.interface import implementer
 
+from plone.namedfile.interfaces import IBlobStore
 from plone.namedfile.interfaces import INamedBlobFile
 
+from plone.namedfile.utils.io_utils import copy_file
+from plone.namedfile.utils.io_utils import copy_stream
+
+#: The worker pools copying blobs, by number of workers
+_executors = {}
+_executors_lock = threading.Lock()
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = \
+                ThreadPoolExecutor(max_workers)
+        return executor
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+class _PendingBlobCopies(object):
+    """
+    The blob copies of a transaction running in worker threads
+    """
+
+    def __init__(self, txn):
+        self.copies = []
+        txn.addBeforeCommitHook(self.join)
+        txn.addAfterAbortHook(self.discard)
+
+    def add(self, future, blob, filename):
+        self.copies.append((future, blob, filename))
+
+    def join(self):
+        """
+        Wait for the copies and move them into their blobs, raising the
+        first error of a copy after all of them are done.
+        """
+        copies, self.copies = self.copies, []
+        exc_info = None
+        for future, blob, filename in copies:
+            try:
+                future.result()
+                if exc_info is None:
+                    blob.consumeFile(filename)
+                    continue
+            except Exception:  # pylint:disable=broad-except
+                if exc_info is None:
+                    exc_info = sys.exc_info()
+            _remove(filename)
+        if exc_info is not None:
+            try:
+                six.reraise(*exc_info)
+            finally:
+                exc_info = None
+
+    def discard(self, *unused):
+        copies, self.copies = self.copies, []
+        for future, _, filename in copies:
+            if not future.cancel():
+                future.exception()
+            _remove(filename)
+
+
+def join_blob_copies(txn=None):
+    """
+    Wait for the blobs copied in worker threads during the transaction,
+    they are otherwise only complete once it is committed.
+    """
+    txn = txn or transaction.get()
+    try:
+        pending = txn.data(_PendingBlobCopies)
+    except KeyError:
+        return
+    pending.join()
+
+
+def _pending_blob_copies():
+    txn = transaction.get()
+    try:
+        return txn.data(_PendingBlobCopies)
+    except KeyError:
+        pending = _PendingBlobCopies(txn)
+        txn.set_data(_PendingBlobCopies, pending)
+        return pending
+
 
 @implementer(ICopyHook)
 @adapter(INamedBlobFile)
@@ -34,6 +138,18 @@ class BlobFileCopyHook(object):
     A copy hook that fixes the blob after copying
     """
 
+    #: Whether copies share the committed file of their source blob
+    #: through a hard link instead of copying its data. Blobs never write
+    #: their committed files and `NamedBlobFile` unshares the file of a
+    #: copy before writing it, so the data is only copied if needed.
+    share_blobs = False
+
+    #: The number of threads copying the data of committed blobs. The
+    #: copies are then only complete when the transaction is committed or
+    #: `join_blob_copies` is called, and the first copy error is raised
+    #: then. None to copy in the calling thread.
+    copy_workers = None
+
     def __init__(self, context):
         self.context = context
 
@@ -44,9 +160,95 @@ class BlobFileCopyHook(object):
     def _copyBlob(self, translate):
         # pylint: disable=W0212
         target = translate(self.context)
+        key = self.context._blob_key
+        if key is not None:
+            store = queryUtility(IBlobStore)
+            if store is not None and store.get(key) is not None:
+                target._blob = store.add(key, self.context._blob)
+                return
+            target._blob_key = None
         target._blob = Blob()
-        fsrc = self.context._blob.open('r')
-        fdst = target._blob.open('w')
-        shutil.copyfileobj(fsrc, fdst)
-        fdst.close()
-        fsrc.close()
+        committed = self._committedFile()
+        if committed is None:
+            # the source blob has uncommitted data
+            self._copyStream(target._blob)
+            return
+        if self.share_blobs and self._shareBlob(committed, target._blob):
+            return
+        filename = self._tempFile()
+        if filename is None:
+            self._copyStream(target._blob)
+        elif self.copy_workers:
+            self._scheduleCopy(committed, filename, target._blob)
+        else:
+            try:
+                copy_file(committed, filename)
+                target._blob.consumeFile(filename)
+            except Exception:
+                _remove(filename)
+                raise
+
+    def _copyStream(self, blob):
+        """
+        Copy the data of the source blob through its opened file
+        """
+        # pylint: disable=W0212
+        with self.context._blob.open('r') as fsrc:
+            with blob.open('w') as fdst:
+                copy_stream(fsrc, fdst)
+
+    def _committedFile(self):
+        """
+        Return the committed file of the source blob, None if it has
+        uncommitted data
+        """
+        # pylint: disable=W0212
+        try:
+            return self.context._blob.committed()
+        except BlobError:
+            return None
+
+    def _tempFile(self):
+        """
+        Create a file in the temporary directory of the storage, where
+        blobs move rather than copy the files they consume, and return
+        its name, None if it cannot be created.
+        """
+        # pylint: disable=W0212
+        try:
+            storage = self.context._blob._p_jar.db().storage
+            fd, filename = tempfile.mkstemp(
+                dir=storage.temporaryDirectory())
+        except (AttributeError, OSError) as e:
+            logger.debug('Cannot create a temporary blob file: %s', e)
+            return None
+        os.close(fd)
+        return filename
+
+    def _shareBlob(self, committed, blob):
+        """
+        Make the blob a hard link to the committed file of the source
+        blob and return whether it could.
+        """
+        link = self._tempFile()
+        if link is None:
+            return False
+        try:
+            # links cannot replace files
+            os.remove(link)
+            os.link(committed, link)
+        except (AttributeError, OSError):
+            # no hard links on this platform or file system
+            _remove(link)
+            return False
+        blob.consumeFile(link)
+        return True
+
+    def _scheduleCopy(self, committed, filename, blob):
+        """
+        Copy the committed file of the source blob to ``filename`` in a
+        worker thread
+        """
+        future = _executor(self.copy_workers).submit(copy_file,
+                                                     committed, filename)
+        _pending_blob_copies().add(future, blob, filename)
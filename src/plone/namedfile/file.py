@@ -14,39 +14,91 @@ from __future__ import absolute_import
 
 #  pylint: disable=attribute-defined-outside-init
 
+import io
 import six
+import hashlib
+from bisect import bisect_right
 
 from persistent import Persistent
 
 from ZODB.blob import Blob
 
 from zope.component import getUtility
+from zope.component import queryUtility
 
 from zope.interface import implementer
 
 from zope.schema.fieldproperty import FieldProperty
 
-import piexif
-
 import transaction
 
 from plone.namedfile.interfaces import IStorage
+from plone.namedfile.interfaces import IBlobStore
 from plone.namedfile.interfaces import INamedFile
 from plone.namedfile.interfaces import INamedImage
 from plone.namedfile.interfaces import INamedBlobFile
 from plone.namedfile.interfaces import INamedBlobImage
+from plone.namedfile.interfaces import IImageNormalizationQueue
 
-from plone.namedfile.utils import get_exif
+from plone.namedfile.utils import read_exif
+from plone.namedfile.utils import get_exif_summary
 from plone.namedfile.utils import getImageInfo
 from plone.namedfile.utils import rotate_image
+from plone.namedfile.utils import analyze_image
 from plone.namedfile.utils import get_contenttype
 
+from plone.namedfile.utils.io_utils import copy_stream
+from plone.namedfile.utils.io_utils import unshare_file
+from plone.namedfile.utils.io_utils import HashingWriter
+from plone.namedfile.utils.io_utils import COPY_BUFFER_SIZE
+from plone.namedfile.utils.io_utils import WindowedReader
+
+from plone.namedfile.utils.magic_utils import MAGIC_BYTES
+from plone.namedfile.utils.magic_utils import UNKNOWN_TYPES
+from plone.namedfile.utils.magic_utils import sniff_contenttype
+
 MAXCHUNKSIZE = 1 << 16
 
+#: The largest chunk size picked by the adaptive chunking mode
+MAX_ADAPTIVE_CHUNKSIZE = 1 << 22
+
+#: The number of chunks the adaptive chunking mode aims for
+ADAPTIVE_CHUNKS = 128
+
+#: The first window read from blob images to find out their dimensions
 IMAGE_INFO_BYTES = 1024
 
+#: The largest window read at once from blob images
 MAX_INFO_BYTES = 1 << 16
 
+#: The most bytes read from a blob image to find out its dimensions
+MAX_HEADER_BYTES = 1 << 24
+
+#: The `hashlib` algorithm of the digests of the file data
+DIGEST_ALGORITHM = 'sha256'
+
+#: Do not store the EXIF data of blob images, parse it when needed
+EXIF_LAZY = 'lazy'
+
+#: Only store the orientation and resolution EXIF tags of blob images
+EXIF_SUMMARY = 'summary'
+
+#: Store all the EXIF data of blob images
+EXIF_FULL = 'full'
+
+#: Rotate images with an EXIF orientation by transposing their pixels
+ORIENTATION_ROTATE = 'rotate'
+
+#: Keep images as they are and only record their EXIF orientation for
+#: renderers to apply it
+ORIENTATION_RECORD = 'record'
+
+#: Store blob images with an EXIF orientation as they are and schedule
+#: their rotation with the `IImageNormalizationQueue` utility
+ORIENTATION_DEFER = 'defer'
+
+_marker = object()
+
 logger = __import__('logging').getLogger(__name__)
 
 
@@ -57,6 +109,10 @@ class FileChunk(Persistent):
 
     next = None
 
+    # Size of the data of this chunk and of the chunks linked after it.
+    # Only known for chains built by `NamedFile`
+    _size = None
+
     def __init__(self, data):
         self._data = data
 
@@ -64,8 +120,7 @@ class FileChunk(Persistent):
         return self._data[i]
 
     def __len__(self):
-        data = bytes(self)
-        return len(data)
+        return chunks_size(self)
 
     def __bytes__(self):
         next_ = self.next
@@ -94,6 +149,152 @@ except ImportError:  # pragma: no cover
 FILECHUNK_CLASSES = tuple(FILECHUNK_CLASSES)
 
 
+def iterchunks(chunk):
+    """
+    Iterate over the data of a linked list of file chunks.
+
+    Chunks already visited are turned into ghosts so that only one of
+    them is kept in memory at any time.
+    """
+    while chunk is not None:
+        # pylint: disable=protected-access
+        data, next_ = chunk._data, chunk.next
+        # ghosting is a no-op for new or modified chunks
+        chunk._p_deactivate()
+        yield data
+        chunk = next_
+
+
+def chunks_size(chunk):
+    """
+    Return the size of the data of a linked list of file chunks without
+    concatenating it.
+    """
+    size = getattr(chunk, '_size', None)
+    if size is None:
+        size = sum(len(data) for data in iterchunks(chunk))
+    return size
+
+
+def hash_chunks(chunks, algorithm=DIGEST_ALGORITHM):
+    """
+    Return the hex digest of an iterable of data chunks
+    """
+    digest = hashlib.new(algorithm)
+    for data in chunks:
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def adaptive_chunk_size(size,
+                        minimum=MAXCHUNKSIZE,
+                        maximum=MAX_ADAPTIVE_CHUNKSIZE,
+                        chunks=ADAPTIVE_CHUNKS):
+    """
+    Return a chunk size suitable to store ``size`` bytes.
+
+    The chunk size is doubled, starting at ``minimum`` and up to
+    ``maximum``, until the data fits in at most ``chunks`` chunks.
+    """
+    chunk_size = minimum
+    while chunk_size < maximum and chunk_size * chunks < size:
+        chunk_size <<= 1
+    return min(chunk_size, max(minimum, maximum))
+
+
+class FileChunkReader(io.RawIOBase):
+    """
+    A seekable, read-only raw file over a linked list of file chunks.
+
+    The offset of every chunk is recorded the first time it is reached,
+    so reads and seeks only load the chunks up to the requested range.
+    Chunks that have been read through are turned into ghosts.
+    """
+
+    def __init__(self, chunk):
+        super(FileChunkReader, self).__init__()
+        self._chunks = [chunk]
+        self._offsets = [0]
+        #: The end offsets of the chunks loaded so far
+        self._ends = []
+        self._size = None
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            if self._size is None:
+                self._size = chunks_size(self._chunks[0])
+            offset += self._size
+        elif whence != io.SEEK_SET:
+            raise ValueError('Invalid whence (%r)' % whence)
+        if offset < 0:
+            raise ValueError('Negative seek position %r' % offset)
+        self._pos = offset
+        return offset
+
+    def _record(self, idx):
+        """
+        Record where the chunk at ``idx`` ends and the chunk after it,
+        so it is not loaded again to walk past it once it is a ghost.
+        """
+        chunk = self._chunks[idx]
+        # pylint: disable=protected-access
+        end = self._offsets[idx] + len(chunk._data)
+        self._ends.append(end)
+        next_ = chunk.next
+        if next_ is None:
+            self._size = end
+        else:
+            self._chunks.append(next_)
+            self._offsets.append(end)
+
+    def _locate(self, pos):
+        """
+        Return the index of the chunk holding the byte at ``pos`` or
+        ``None`` if it is past the end of the data.
+        """
+        chunks, ends = self._chunks, self._ends
+        idx = bisect_right(self._offsets, pos) - 1
+        while True:
+            if idx == len(ends):
+                self._record(idx)
+            if pos < ends[idx]:
+                return idx
+            if idx == len(chunks) - 1:
+                return None
+            chunks[idx]._p_deactivate()
+            idx += 1
+
+    def readinto(self, b):
+        view = memoryview(b)
+        length, count = len(view), 0
+        while count < length:
+            idx = self._locate(self._pos)
+            if idx is None:
+                break
+            chunk = self._chunks[idx]
+            start = self._pos - self._offsets[idx]
+            # pylint: disable=protected-access
+            data = chunk._data[start:start + length - count]
+            view[count:count + len(data)] = data
+            count += len(data)
+            self._pos += len(data)
+            if self._pos == self._ends[idx]:
+                chunk._p_deactivate()
+        return count
+
+
 @implementer(INamedFile)
 class NamedFile(Persistent):
     """
@@ -188,12 +389,35 @@ class NamedFile(Persistent):
 
     filename = FieldProperty(INamedFile['filename'])
 
+    _size = None
+
+    _digest = None
+
+    #: The `hashlib` algorithm of the digest of the data, None to not
+    #: compute it
+    digest_algorithm = DIGEST_ALGORITHM
+
+    #: The size of the chunks the data is split into
+    chunk_size = MAXCHUNKSIZE
+
+    #: Grow the chunk size with the size of the data
+    adaptive_chunks = False
+
+    #: Take a savepoint every time this many chunks have been built
+    savepoint_chunks = 1
+
+    #: Take a savepoint every time this many bytes have been chunked
+    savepoint_bytes = None
+
     def __init__(self, data=b'', contentType=b'', filename=None):
-        if      filename is not None  \
-            and contentType in (b'', b'application/octet-stream'):
+        sniff = contentType in UNKNOWN_TYPES
+        if filename is not None and sniff:
             contentType = get_contenttype(filename=filename)
         self.data = data
         self.filename = filename
+        if sniff:
+            contentType = sniff_contenttype(self._getFirstBytes(),
+                                            contentType)
         self.contentType = contentType
 
     def _getData(self):
@@ -202,23 +426,49 @@ class NamedFile(Persistent):
         else:
             return self._data
 
-    def _setData(self, data):
+    def _getChunkSize(self, size, chunk_size=None, adaptive=None):
+        """
+        Return the chunk size to use to store ``size`` bytes
+        """
+        chunk_size = chunk_size or self.chunk_size
+        adaptive = self.adaptive_chunks if adaptive is None else adaptive
+        if adaptive:
+            chunk_size = adaptive_chunk_size(size, minimum=chunk_size)
+        return chunk_size
+
+    def _isSavepointDue(self, chunks, size):
+        """
+        Return whether the chunks built since the last savepoint, holding
+        ``size`` bytes, should be saved
+        """
+        return (self.savepoint_chunks and chunks >= self.savepoint_chunks) \
+            or (self.savepoint_bytes and size >= self.savepoint_bytes)
+
+    def _setData(self, data, chunk_size=None, adaptive=None):
+        """
+        Set the data of this file.
+
+        ``chunk_size`` and ``adaptive`` override the `chunk_size` and
+        `adaptive_chunks` settings of the class for this call.
+        """
+        # Handle case when data is None
+        if data is None:
+            raise TypeError('Cannot set None data on a file.')
 
         # Handle case when data is a string
         if isinstance(data, six.text_type):
             data = data.encode('utf-8')
 
+        if self._digest is not None:
+            self._digest = None
+
         if isinstance(data, six.binary_type):
             self._data, self._size = FileChunk(data), len(data)
             return
 
-        # Handle case when data is None
-        if data is None:
-            raise TypeError('Cannot set None data on a file.')
-
         # Handle case when data is already a FileChunk
         if isinstance(data, FILECHUNK_CLASSES):
-            size = len(data)
+            size = chunks_size(data)
             self._data, self._size = data, size
             return
 
@@ -228,10 +478,11 @@ class NamedFile(Persistent):
 
         seek(0, 2)
         size = end = data.tell()
+        chunk_size = self._getChunkSize(size, chunk_size, adaptive)
 
-        if size <= 2 * MAXCHUNKSIZE:
+        if size <= 2 * chunk_size:
             seek(0)
-            if size < MAXCHUNKSIZE:
+            if size < chunk_size:
                 self._data, self._size = read(size), size
                 return
             self._data, self._size = FileChunk(read(size)), size
@@ -254,10 +505,11 @@ class NamedFile(Persistent):
         # and to allow us to get things out of memory as soon as
         # possible.
         next_ = None
+        batch, batch_size = [], 0
         while end > 0:
-            pos = end - MAXCHUNKSIZE
-            if pos < MAXCHUNKSIZE:
-                pos = 0  # we always want at least MAXCHUNKSIZE bytes
+            pos = end - chunk_size
+            if pos < chunk_size:
+                pos = 0  # we always want at least chunk_size bytes
             seek(pos)
             data = FileChunk(read(end - pos))
 
@@ -269,14 +521,20 @@ class NamedFile(Persistent):
             # This is needed and has side benefit of getting
             # the thing registered:
             data.next = next_
+            # pylint: disable=protected-access
+            data._size = size - pos
 
-            # Now make it get saved in a sub-transaction!
-            transaction.savepoint(optimistic=True)
+            batch.append(data)
+            batch_size += end - pos
+            if pos == 0 or self._isSavepointDue(len(batch), batch_size):
+                # Now make the batch get saved in a sub-transaction!
+                transaction.savepoint(optimistic=True)
 
-            # Now make it a ghost to free the memory.  We
-            # don't need it anymore!
-            # pylint: disable=protected-access
-            data._p_changed = None
+                # Now make them ghosts to free the memory.  We
+                # don't need them anymore!
+                for chunk in batch:
+                    chunk._p_changed = None
+                batch, batch_size = [], 0
 
             next_ = data
             end = pos
@@ -284,12 +542,56 @@ class NamedFile(Persistent):
         self._data, self._size = next_, size
         return
 
+    def _getFirstBytes(self):
+        """
+        Return the first bytes of the data, only loading its first chunk
+        """
+        data = self._data
+        if isinstance(data, FILECHUNK_CLASSES):
+            # pylint: disable=protected-access
+            data = data._data
+        return data[:MAGIC_BYTES]
+
     def getSize(self):
         '''
         See `IFile`
         '''
+        if self._size is None and isinstance(self._data, FILECHUNK_CLASSES):
+            return chunks_size(self._data)
         return self._size
 
+    def getDigest(self):
+        '''
+        See `IFile`
+        '''
+        if self._digest is None and self.digest_algorithm:
+            # computed once, storing the data stays a plain copy
+            self._digest = hash_chunks(self.iterchunks(),
+                                       self.digest_algorithm)
+        return self._digest
+
+    def open(self, mode='r'):
+        """
+        Return a seekable, read-only file over the data of this file
+        """
+        if mode != 'r':
+            raise ValueError('Invalid mode (%r), only "r" is supported' % mode)
+        if isinstance(self._data, FILECHUNK_CLASSES):
+            return io.BufferedReader(FileChunkReader(self._data))
+        return io.BytesIO(self._data)
+
+    def iterchunks(self):
+        """
+        Iterate over the data of this file without loading it all in
+        memory, empty chunks are skipped
+        """
+        if isinstance(self._data, FILECHUNK_CLASSES):
+            for data in iterchunks(self._data):
+                if data:
+                    yield data
+        elif self._data:
+            yield self._data
+
     # See IFile.
     data = property(_getData, _setData)
 
@@ -301,32 +603,79 @@ class NamedImage(NamedFile):
     """
     filename = FieldProperty(INamedFile['filename'])
 
+    #: How new images with an EXIF orientation are handled, either
+    #: `ORIENTATION_ROTATE` or `ORIENTATION_RECORD`
+    orientation_mode = ORIENTATION_ROTATE
+
+    #: The EXIF orientation renderers must apply to the image data
+    orientation = 1
+
     # pylint: disable=super-init-not-called
     def __init__(self, data=b'', contentType=b'', filename=None):
-        self.contentType, self._width, self._height = getImageInfo(data)
         self.filename = filename
-        self._setData(data)
+        info = self._setImageData(data)
 
         # Allow override of the image sniffer
-        if contentType:
-            self.contentType = contentType
+        self.contentType = contentType or info.content_type
+
+        rotated = 1 < info.orientation <= 8
+        if rotated and self.orientation_mode != ORIENTATION_RECORD:
+            logger.debug('Image has Exif Orientation %s. Rotate it.',
+                         info.orientation)
+            data, self._width, self._height, self.exif = \
+                rotate_image(self.data)
+            NamedFile._setData(self, data)
+            self.__dict__.pop('_v_exif_data', None)
+
+    def _getExifData(self):
+        self._p_activate()
+        # stored by earlier versions
+        exif_data = self.__dict__.get('exif_data')
+        if exif_data is None:
+            exif_data = self.__dict__.get('_v_exif_data', _marker)
+            if exif_data is _marker:
+                with self.open() as fp:
+                    exif_data = self._v_exif_data = read_exif(fp)
+        return exif_data
+
+    def _setExifData(self, exif_data):
+        self.__dict__['exif_data'] = exif_data
+        self._p_changed = True
+
+    # The EXIF data, parsed from the image the first time it is needed
+    exif_data = property(_getExifData, _setExifData)
+
+    def _setImageData(self, data, chunk_size=None, adaptive=None, exif=False):
+        """
+        Set the data of this image and return its `ImageAnalysis`.
 
-        exif_data = get_exif(data)
-        if exif_data is not None:
-            logger.debug('Image contains Exif Informations. '
-                         'Test for Image Orientation and Rotate if necessary.'
-                         'Exif Data: %s', exif_data)
-            orientation = exif_data['0th'].get(piexif.ImageIFD.Orientation, 1)
-            if 1 < orientation <= 8:
-                values = rotate_image(self.data)
-                self.data, self._width, self._height, self.exif = values
-            self.exif_data = exif_data
+        The image headers are only sniffed once, the EXIF data is only
+        parsed if ``exif`` is true.
+        """
+        super(NamedImage, self)._setData(data, chunk_size, adaptive)
+        self.__dict__.pop('exif_data', None)
+        self.__dict__.pop('_v_exif_data', None)
+        with self.open() as fp:
+            info = analyze_image(fp, exif=exif)
+        self._width, self._height = info.width, info.height
+        self._recordOrientation(info.orientation)
+        if info.content_type:
+            self.contentType = info.content_type
+        return info
+
+    def _recordOrientation(self, orientation):
+        """
+        Record the EXIF orientation of new image data if renderers must
+        apply it
+        """
+        if      1 < orientation <= 8 \
+            and self.orientation_mode == ORIENTATION_RECORD:
+            self.orientation = orientation
+        else:
+            self.__dict__.pop('orientation', None)
 
-    def _setData(self, data):
-        super(NamedImage, self)._setData(data)
-        contentType, self._width, self._height = getImageInfo(self._data)
-        if contentType:
-            self.contentType = contentType
+    def _setData(self, data, chunk_size=None, adaptive=None):
+        self._setImageData(data, chunk_size, adaptive)
 
     def getImageSize(self):
         '''
@@ -337,6 +686,40 @@ class NamedImage(NamedFile):
     data = property(NamedFile._getData, _setData)
 
 
+class _HashingBlob(object):
+    """
+    Passes the data stored into a blob through a hash, keeping its first
+    `MAGIC_BYTES` bytes
+    """
+
+    def __init__(self, blob, digest):
+        self.blob = blob
+        self.digest = digest
+        self._writer = None
+        self._header = b''
+
+    @property
+    def header(self):
+        if self._writer is not None:
+            return self._writer.header
+        return self._header
+
+    def open(self, mode='r'):
+        fp = self.blob.open(mode)
+        if mode == 'w':
+            fp = self._writer = HashingWriter(fp, self.digest, MAGIC_BYTES)
+        return fp
+
+    def consumeFile(self, filename):
+        with open(filename, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(COPY_BUFFER_SIZE), b''):
+                if not self._header:
+                    self._header = chunk[:MAGIC_BYTES]
+                self.digest.update(chunk)
+        self._writer = None
+        self.blob.consumeFile(filename)
+
+
 @implementer(INamedBlobFile)
 class NamedBlobFile(Persistent):
     """
@@ -345,35 +728,119 @@ class NamedBlobFile(Persistent):
 
     filename = FieldProperty(INamedFile['filename'])
 
+    #: The size of the blob as returned by the storable that stored it,
+    #: None when it was not known
+    _size = None
+
+    #: The digest of the data, computed when it is first asked for or
+    #: when it is stored through the `IBlobStore` utility
+    _digest = None
+
+    #: The `hashlib` algorithm of the digest of the data, None to not
+    #: compute it
+    digest_algorithm = DIGEST_ALGORITHM
+
+    #: The key of the blob shared through the `IBlobStore` utility, the
+    #: digest of the data with the algorithm of the store
+    _blob_key = None
+
     def __init__(self, data=b'', contentType=b'', filename=None):
-        if      filename is not None \
-            and contentType in (b'', b'application/octet-stream'):
+        sniff = contentType in UNKNOWN_TYPES
+        if filename is not None and sniff:
             contentType = get_contenttype(filename=filename)
-        self.contentType = contentType
         self._blob = Blob()
-        f = self._blob.open('w')
-        f.write(b'')
-        f.close()
-        self._setData(data)
+        header = self._storeData(data)
+        if sniff:
+            if header is None:
+                with self._blob.open('r') as fp:
+                    header = fp.read(MAGIC_BYTES)
+            contentType = sniff_contenttype(header, contentType)
+        self.contentType = contentType
         self.filename = filename
 
     def open(self, mode='r'):
-        if mode != 'r' and 'size' in self.__dict__:
-            del self.__dict__['size']
+        if mode != 'r':
+            self._invalidateSize()
+            self._detachBlob(keep=mode != 'w')
+            self._unshareBlob(keep=mode != 'w')
+            self._invalidateDigest()
         return self._blob.open(mode)
 
     def openDetached(self):
         return open(self._blob.committed(), 'rb')
 
+    def _invalidateSize(self):
+        if self._size is not None:
+            self._size = None
+        self.__dict__.pop('_v_size', None)
+        # sizes cached by previous versions
+        self.__dict__.pop('size', None)
+
+    def _unshareBlob(self, keep=True):
+        """
+        Make sure the uncommitted file of the blob is not a hard link to
+        the file of another blob before it is written.
+
+        See `BlobFileCopyHook.share_blobs`.
+        """
+        # pylint: disable=protected-access
+        unshare_file(self._blob._p_blob_uncommitted, keep)
+
+    def _detachBlob(self, keep=True):
+        """
+        Give this file a blob of its own before it is written if it
+        shares one through the `IBlobStore` utility, with a copy of the
+        data if ``keep`` is true.
+        """
+        if self._blob_key is None:
+            return
+        blob = Blob()
+        if keep:
+            with self._blob.open('r') as fsrc:
+                with blob.open('w') as fdst:
+                    copy_stream(fsrc, fdst)
+        store = queryUtility(IBlobStore)
+        if store is not None:
+            store.release(self._blob_key)
+        self._blob = blob
+        self._blob_key = None
+
+    def _invalidateDigest(self):
+        if self._digest is not None:
+            self._digest = None
+
     def _setData(self, data):
-        if 'size' in self.__dict__:
-            del self.__dict__['size']
+        self._storeData(data)
+
+    def _storeData(self, data):
+        """
+        Store the data and return its first `MAGIC_BYTES` bytes when
+        they went through Python, None otherwise.
+        """
+        self._invalidateSize()
+        self._detachBlob(keep=False)
+        self._unshareBlob(keep=False)
         # Search for a storable that is able to store the data
         dottedName = '.'.join((data.__class__.__module__,
                                data.__class__.__name__))
         logger.debug('Storage selected for data: %s', dottedName)
         storable = getUtility(IStorage, name=dottedName)
-        storable.store(data, self._blob)
+        store = queryUtility(IBlobStore)
+        self._invalidateDigest()
+        if store is None:
+            # the data is left to the storable, which may have the
+            # kernel copy it
+            self._size = storable.store(data, self._blob)
+            return None
+        # hash the data as the storable stores it to find a blob of the
+        # same data to share
+        hashing = _HashingBlob(Blob(), hashlib.new(store.algorithm))
+        self._size = storable.store(data, hashing)
+        self._blob_key = hashing.digest.hexdigest()
+        if store.algorithm == self.digest_algorithm:
+            self._digest = self._blob_key
+        self._blob = store.add(self._blob_key, hashing.blob)
+        return hashing.header
 
     def _getData(self):
         fp = self._blob.open('r')
@@ -386,18 +853,30 @@ class NamedBlobFile(Persistent):
 
     @property
     def size(self):
-        if 'size' in self.__dict__:
-            return self.__dict__['size']
-        reader = self._blob.open()
-        reader.seek(0, 2)
-        size = int(reader.tell())
-        reader.close()
-        self.__dict__['size'] = size
+        if self._size is not None:
+            return self._size
+        # not known when stored, or stored by a previous version
+        size = self.__dict__.get('_v_size')
+        if size is None:
+            with self._blob.open() as reader:
+                reader.seek(0, 2)
+                size = self._v_size = int(reader.tell())
         return size
 
     def getSize(self):
         return self.size
 
+    def getDigest(self):
+        """
+        See `IFile`
+        """
+        if self._digest is None and self.digest_algorithm:
+            # computed once, storing the data stays a plain copy
+            with self._blob.open('r') as fp:
+                chunks = iter(lambda: fp.read(COPY_BUFFER_SIZE), b'')
+                self._digest = hash_chunks(chunks, self.digest_algorithm)
+        return self._digest
+
 
 @implementer(INamedBlobImage)
 class NamedBlobImage(NamedBlobFile):
@@ -405,37 +884,155 @@ class NamedBlobImage(NamedBlobFile):
     An image stored in a ZODB BLOB with a filename
     """
 
+    #: How much of the EXIF data is stored with the image, one of
+    #: `EXIF_LAZY`, `EXIF_SUMMARY` or `EXIF_FULL`
+    exif_storage = EXIF_LAZY
+
+    #: The stored `get_exif_summary` of the EXIF data
+    exif_summary = None
+
+    #: How new images with an EXIF orientation are handled, one of
+    #: `ORIENTATION_ROTATE`, `ORIENTATION_RECORD` or `ORIENTATION_DEFER`
+    orientation_mode = ORIENTATION_ROTATE
+
+    #: The EXIF orientation renderers must apply to the image data
+    orientation = 1
+
+    #: Whether the dimensions were read when the data was stored, they
+    #: are then final even if unknown
+    _sniffed = False
+
+    # pylint: disable=super-init-not-called
     def __init__(self, data=b'', contentType=b'', filename=None):
-        super(NamedBlobImage, self).__init__(data, contentType, filename)
+        if      filename is not None \
+            and contentType in (b'', b'application/octet-stream'):
+            self.contentType = get_contenttype(filename=filename)
+        else:
+            self.contentType = contentType
+        self._blob = Blob()
+        info = self._setImageData(data)
+        self.filename = filename
+
+        orientation = info.orientation
+        if      1 < orientation <= 8 \
+            and self.orientation_mode not in (ORIENTATION_RECORD,
+                                              ORIENTATION_DEFER):
+            self.normalizeOrientation(orientation)
+
         # Allow override of the image sniffer
         if contentType:
             self.contentType = contentType
 
-        exif_data = get_exif(self.data)
-        if exif_data is not None:
-            logger.debug('Image contains Exif Informations. '
-                         'Test for Image Orientation and Rotate if necessary.'
-                         'Exif Data: %s', exif_data)
-            orientation = exif_data['0th'].get(piexif.ImageIFD.Orientation, 1)
-            if 1 < orientation <= 8:
-                values = rotate_image(self.data)
-                self.data, self._width, self._height, self.exif = values
-            else:
-                self.exif = exif_data
+    def normalizeOrientation(self, orientation=None):
+        """
+        Rotate the image data according to its recorded EXIF orientation.
+
+        Return whether the image was rotated.
+        """
+        orientation = orientation or self.orientation
+        if not 1 < orientation <= 8:
+            return False
+        logger.debug('Image has Exif Orientation %s. Rotate it.',
+                     orientation)
+        values = rotate_image(self.data)
+        self.data, self._width, self._height, self.exif = values
+        self.__dict__.pop('orientation', None)
+        self._p_changed = True
+        return True
+
+    def _recordOrientation(self, orientation):
+        """
+        Record the EXIF orientation of new image data if renderers must
+        apply it, scheduling its normalization in `ORIENTATION_DEFER` mode
+        """
+        mode = self.orientation_mode
+        if      1 < orientation <= 8 \
+            and mode in (ORIENTATION_RECORD, ORIENTATION_DEFER):
+            self.orientation = orientation
+            if mode == ORIENTATION_DEFER:
+                queue = queryUtility(IImageNormalizationQueue)
+                if queue is not None:
+                    queue.schedule(self)
+        else:
+            self.__dict__.pop('orientation', None)
 
-    def _setData(self, data):
+    def _loadExif(self):
+        with self.open('r') as fp:
+            return read_exif(fp)
+
+    def _storeExif(self, exif_data):
+        """
+        Store the EXIF data as much as `exif_storage` tells to
+        """
+        self.__dict__.pop('exif', None)
+        self.__dict__.pop('exif_summary', None)
+        if exif_data is not None and self.exif_storage == EXIF_FULL:
+            self.__dict__['exif'] = exif_data
+        elif exif_data is not None and self.exif_storage == EXIF_SUMMARY:
+            self.__dict__['exif_summary'] = get_exif_summary(exif_data)
+        self._p_changed = True
+
+    def _getExif(self):
+        self._p_activate()
+        exif_data = self.__dict__.get('exif')
+        if exif_data is None:
+            exif_data = self.__dict__.get('_v_exif', _marker)
+            if exif_data is _marker:
+                exif_data = self._v_exif = self._loadExif()
+        return exif_data
+
+    def _setExif(self, exif_data):
+        self._v_exif = exif_data
+        self._storeExif(exif_data)
+
+    # The EXIF data, parsed from the EXIF segment of the image the
+    # first time it is needed unless it is stored
+    exif = property(_getExif, _setExif)
+
+    def _setImageData(self, data):
+        """
+        Set the data of this image and return its `ImageAnalysis`.
+
+        The stored blob is opened once to read the dimensions, the
+        orientation and, unless it is loaded lazily, the EXIF data.
+        """
         super(NamedBlobImage, self)._setData(data)
-        firstbytes = self.getFirstBytes()
-        res = getImageInfo(firstbytes)
-        if res == ('image/jpeg', -1, -1) or res == ('image/tiff', -1, -1):
-            # header was longer than firstbytes
-            start = len(firstbytes)
-            length = max(0, MAX_INFO_BYTES - start)
-            firstbytes += self.getFirstBytes(start, length)
-            res = getImageInfo(firstbytes)
-        contentType, self._width, self._height = res
-        if contentType:
-            self.contentType = contentType
+        self.__dict__.pop('_v_exif', None)
+        with self.open('r') as fp:
+            info = analyze_image(self._headerReader(fp), exif=False)
+            if self.exif_storage != EXIF_LAZY:
+                fp.seek(0)
+                info = info._replace(exif=read_exif(fp))
+        self._width, self._height = info.width, info.height
+        self._sniffed = True
+        self._recordOrientation(info.orientation)
+        if self.exif_storage == EXIF_LAZY:
+            self._storeExif(None)
+        else:
+            self.exif = info.exif
+        if info.content_type:
+            self.contentType = info.content_type
+        return info
+
+    def _setData(self, data):
+        self._setImageData(data)
+
+    def _headerReader(self, fp):
+        return WindowedReader(fp,
+                              IMAGE_INFO_BYTES,
+                              MAX_INFO_BYTES,
+                              MAX_HEADER_BYTES)
+
+    def _sniffImageInfo(self):
+        """
+        Read the content type and dimensions from the image headers and
+        record them, even when they cannot be found out.
+        """
+        with self.open('r') as fp:
+            res = getImageInfo(self._headerReader(fp))
+        _, self._width, self._height = res
+        self._sniffed = True
+        return res
 
     data = property(NamedBlobFile._getData, _setData)
 
@@ -444,18 +1041,18 @@ class NamedBlobImage(NamedBlobFile):
         Returns the first bytes of the file.
 
         Returns an amount which is sufficient to determine the image type.
+        The dimensions of images are no longer read from it but through a
+        `WindowedReader`.
         """
-        fp = self.open('r')
-        fp.seek(start)
-        firstbytes = fp.read(length)
-        fp.close()
-        return firstbytes
+        with self.open('r') as fp:
+            fp.seek(start)
+            return fp.read(length)
 
     def getImageSize(self):
         """
         See interface `IImage`
         """
-        if (self._width, self._height) != (-1, -1):
-            return (self._width, self._height)
-        _, self._width, self._height = getImageInfo(self.data)
+        if not self._sniffed and (self._width, self._height) == (-1, -1):
+            # stored by a previous version
+            self._sniffImageInfo()
         return (self._width, self._height)
@@ -15,6 +15,7 @@ from io import FileIO
 from io import BytesIO
 from io import StringIO
 from io import TextIOWrapper
+from io import BufferedRandom
 from io import BufferedReader
 
 from zope import schema
@@ -50,6 +51,13 @@ class IFile(interface.Interface):
         Return the byte-size of the data of the object.
         """
 
+    def getDigest():
+        """
+        Return the hex digest of the data of the object, computed the
+        first time it is asked for, to use as an entity tag. None if the
+        object does not compute digests.
+        """
+
 
 class IImage(IFile):
     """
@@ -96,6 +104,9 @@ class IStorage(interface.Interface):
         """
         Store the data into the blob
         Raises NonStorable if data is not storable.
+
+        Returns the number of bytes stored, or None when it is not
+        known without reading the blob.
         """
 
 
@@ -126,6 +137,50 @@ class INamedBlobImage(INamedImage, IBlobby):
     """
 
 
+class IImageNormalizationQueue(interface.Interface):
+    """
+    Normalizes the orientation of images out of the request that
+    stored them
+    """
+
+    def schedule(image):
+        """
+        Schedule the orientation of the image to be normalized
+        """
+
+
+class IBlobStore(interface.Interface):
+    """
+    A content addressed store of blobs, shared by the blob files with
+    the same data
+    """
+
+    def add(digest, blob):
+        """
+        Return the stored blob with the digest, storing the given one if
+        there is none, and count one more reference to it.
+        """
+
+    def get(digest, default=None):
+        """
+        Return the stored blob with the digest
+        """
+
+    def release(digest):
+        """
+        Count one less reference to the blob with the digest, removing it
+        from the store when it is no longer referenced.
+        """
+
+    def sweep(digests):
+        """
+        Recount the references to the stored blobs from the digests of
+        all the blob files using them and remove the unreferenced blobs.
+
+        Return the number of blobs removed.
+        """
+
+
 class IFileIO(interface.Interface):
     """
     Defines an python file builtin.
@@ -139,3 +194,4 @@ classImplements(BytesIO, IFileIO)
 classImplements(StringIO, IFileIO)
 classImplements(TextIOWrapper, IFileIO)
 classImplements(BufferedReader, IFileIO)
+classImplements(BufferedRandom, IFileIO)
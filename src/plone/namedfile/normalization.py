@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Queues normalizing the orientation of images stored with the
+``ORIENTATION_DEFER`` mode.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from concurrent.futures import ThreadPoolExecutor
+
+import transaction
+
+from zope.interface import implementer
+
+from plone.namedfile.interfaces import IImageNormalizationQueue
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@implementer(IImageNormalizationQueue)
+class LocalNormalizationQueue(object):
+    """
+    Keeps the scheduled images in memory until `process` is called
+    """
+
+    def __init__(self):
+        self.images = []
+
+    def schedule(self, image):
+        self.images.append(image)
+
+    def process(self):
+        """
+        Normalize the scheduled images in the current transaction and
+        return the number of rotated ones
+        """
+        images, self.images = self.images, []
+        return len([image for image in images if image.normalizeOrientation()])
+
+
+@implementer(IImageNormalizationQueue)
+class AfterCommitNormalizationQueue(object):
+    """
+    Normalizes the scheduled images once the transaction storing them is
+    committed.
+
+    Each image is loaded and normalized in its own connection and
+    transaction by a pool of worker threads.
+    """
+
+    def __init__(self, max_workers=1, transaction_manager=None):
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.transaction_manager = transaction_manager or transaction.manager
+
+    def schedule(self, image):
+        txn = self.transaction_manager.get()
+        txn.addAfterCommitHook(self._afterCommit, (image,))
+
+    def _afterCommit(self, status, image):
+        # pylint: disable=protected-access
+        if status and image._p_jar is not None:
+            self.executor.submit(self.normalize,
+                                 image._p_jar.db(), image._p_oid)
+
+    def normalize(self, db, oid):
+        """
+        Normalize the image stored in ``db`` with ``oid``
+        """
+        tm = transaction.TransactionManager()
+        conn = db.open(transaction_manager=tm)
+        try:
+            for attempt in tm.attempts():
+                with attempt:
+                    conn.get(oid).normalizeOrientation()
+        except Exception:  # pylint:disable=broad-except
+            logger.exception('Could not normalize image %r', oid)
+        finally:
+            conn.close()
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads, waiting for the scheduled images to be
+        normalized if ``wait`` is true
+        """
+        self.executor.shutdown(wait=wait)
@@ -11,17 +11,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import os
+
 import six
 
 from zope.interface import implementer
 
 from plone.namedfile.file import FileChunk
+from plone.namedfile.file import MAXCHUNKSIZE  # pylint: disable=unused-import
 
 from plone.namedfile.interfaces import IFileIO
 from plone.namedfile.interfaces import IStorage
 from plone.namedfile.interfaces import NotStorable
 
-MAXCHUNKSIZE = 1 << 16
+from plone.namedfile.utils.io_utils import copy_stream
+from plone.namedfile.utils.io_utils import COPY_BUFFER_SIZE
 
 logger = __import__('logging').getLogger(__name__)
 
@@ -35,6 +39,7 @@ class BinaryStorable(object):
 
         with blob.open('w') as fp:
             fp.write(data)
+        return len(data)
 StringStorable = BinaryStorable
 
 
@@ -46,7 +51,7 @@ class UnicodeStorable(BinaryStorable):
             raise NotStorable('Could not store data (not of "unicode" type).')
 
         data = data.encode('utf-8')
-        BinaryStorable.store(self, data, blob)
+        return BinaryStorable.store(self, data, blob)
 
 
 @implementer(IStorage)
@@ -56,21 +61,63 @@ class FileChunkStorable(object):
         if not isinstance(data, FileChunk):
             raise NotStorable('Could not store data (not a of "FileChunk" type).')  # noqa
 
+        size = 0
         with blob.open('w') as fp:
             chunk = data
             while chunk:
                 # pylint: disable=protected-access
                 fp.write(chunk._data)
+                size += len(chunk._data)
                 chunk = chunk.next
+        return size
+
+
+@implementer(IStorage)
+class IterableStorable(object):
+    """
+    Stores an iterable of byte (or unicode) chunks, such as a generator
+    reading a WSGI input, as the chunks are produced.
+    """
+
+    def store(self, data, blob):
+        if isinstance(data, (six.binary_type, six.text_type)):
+            raise NotStorable('Could not store data (not an iterable of chunks).')  # noqa
+        try:
+            chunks = iter(data)
+        except TypeError:
+            raise NotStorable('Could not store data (not iterable).')
+
+        size = 0
+        with blob.open('w') as fp:
+            for chunk in chunks:
+                if isinstance(chunk, six.text_type):
+                    chunk = chunk.encode('utf-8')
+                fp.write(chunk)
+                size += len(chunk)
+        return size
 
 
 @implementer(IStorage)
 class FileDescriptorStorable(object):
+    """
+    Stores a file. Named files are moved into the blob, other streams
+    are copied from their current position, in the kernel when both
+    are backed by file descriptors.
+    """
+
+    #: The size of the buffer used to copy streams through Python
+    buffer_size = COPY_BUFFER_SIZE
 
     def store(self, data, blob):
         if not IFileIO.providedBy(data):
             raise NotStorable('Could not store data (not of "file").')
 
+        # temporary files only have a file descriptor as name
         filename = getattr(data, 'name', None)
-        if filename is not None:
+        if isinstance(filename, six.string_types):
+            size = os.path.getsize(filename)
             blob.consumeFile(filename)
+            return size
+
+        with blob.open('w') as fp:
+            return copy_stream(data, fp, self.buffer_size)
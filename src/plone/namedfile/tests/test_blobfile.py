@@ -8,6 +8,8 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods
 
 from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import has_length
 from hamcrest import equal_to
 from hamcrest import assert_that
 from hamcrest import has_property
@@ -16,11 +18,22 @@ from hamcrest import has_properties
 from nti.testing.matchers import validly_provides
 from nti.testing.matchers import verifiably_provides
 
+import os
+import shutil
 import struct
+import tempfile
 import unittest
 
+import fudge
+
 import transaction
 
+from ZODB import DB
+
+from ZODB.blob import BlobStorage
+
+from ZODB.MappingStorage import MappingStorage
+
 from plone.namedfile.file import NamedBlobFile
 from plone.namedfile.file import NamedBlobImage
 
@@ -102,3 +115,242 @@ class TestImageFunctional(unittest.TestCase):
 
         image_copy = copy(image)
         assert_that(image_copy.data, is_(image.data))
+
+    def _openBlobConnection(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        self.addCleanup(db.close)
+        conn = db.open()
+        self.addCleanup(conn.close)
+        self.addCleanup(transaction.abort)
+        return conn
+
+    def testCopyCommittedBlobs(self):
+        from zope.copy import copy
+        conn = self._openBlobConnection()
+        source = NamedBlobFile(b'hello, world')
+        conn.root()['source'] = source
+        transaction.commit()
+
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+        uncommitted = file_copy._blob._p_blob_uncommitted
+        assert_that(os.stat(uncommitted).st_ino,
+                    is_not(os.stat(source._blob.committed()).st_ino))
+
+    def testCopyTemporaryFiles(self):
+        from zope.copy import copy
+        from plone.namedfile import copy as copy_module
+        conn = self._openBlobConnection()
+        source = NamedBlobFile(b'hello, world')
+        conn.root()['source'] = source
+        transaction.commit()
+        blob_dir = os.path.dirname(source._blob.committed())
+        files = sorted(os.listdir(blob_dir))
+
+        made = []
+
+        class RecordingTempfile(object):
+
+            @staticmethod
+            def mkstemp(*args, **kw):
+                res = tempfile.mkstemp(*args, **kw)
+                made.append(res[1])
+                return res
+
+        copy_module.tempfile = RecordingTempfile
+        self.addCleanup(setattr, copy_module, 'tempfile', tempfile)
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+        assert_that(made, has_length(1))
+        assert_that(os.path.dirname(made[0]),
+                    is_(conn.db().storage.temporaryDirectory()))
+        assert_that(sorted(os.listdir(blob_dir)), is_(files))
+
+        # copied through the blobs if no temporary file can be created
+        class FailingTempfile(object):
+
+            @staticmethod
+            def mkstemp(*args, **kw):
+                raise OSError(13, 'Permission denied')
+
+        copy_module.tempfile = FailingTempfile
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+
+    @fudge.patch('plone.namedfile.copy.copy_file')
+    def testCopyErrors(self, mock_copy):
+        from zope.copy import copy
+        conn = self._openBlobConnection()
+        source = NamedBlobFile(b'hello, world')
+        conn.root()['source'] = source
+        transaction.commit()
+        temp_dir = conn.db().storage.temporaryDirectory()
+        files = sorted(os.listdir(temp_dir))
+
+        mock_copy.is_callable().raises(IOError('disk full'))
+        with self.assertRaises(IOError):
+            copy(source)
+        assert_that(sorted(os.listdir(temp_dir)), is_(files))
+
+    def testShareBlobs(self):
+        from zope.copy import copy
+        from plone.namedfile.copy import BlobFileCopyHook
+        conn = self._openBlobConnection()
+
+        BlobFileCopyHook.share_blobs = True
+        self.addCleanup(setattr, BlobFileCopyHook, 'share_blobs', False)
+
+        source = NamedBlobFile(b'hello, world')
+        # uncommitted blobs are copied
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+
+        conn.root()['source'] = source
+        transaction.commit()
+
+        file_copy = copy(source)
+        committed = source._blob.committed()
+        uncommitted = file_copy._blob._p_blob_uncommitted
+        assert_that(os.stat(uncommitted).st_ino,
+                    is_(os.stat(committed).st_ino))
+        assert_that(file_copy.data, is_(b'hello, world'))
+
+        conn.root()['copy'] = file_copy
+        transaction.commit()
+        assert_that(os.stat(file_copy._blob.committed()).st_ino,
+                    is_(os.stat(committed).st_ino))
+
+        # writes to either side leave the other one alone
+        other = copy(source)
+        with other.open('a') as fp:
+            fp.write(b'!')
+        assert_that(other.data, is_(b'hello, world!'))
+        assert_that(source.data, is_(b'hello, world'))
+
+        other = copy(source)
+        other.data = b'bye'
+        assert_that(source.data, is_(b'hello, world'))
+
+        with file_copy.open('w') as fp:
+            fp.write(b'bye')
+        transaction.commit()
+        assert_that(source.data, is_(b'hello, world'))
+        assert_that(file_copy.data, is_(b'bye'))
+
+    def testShareBlobsWithoutLinks(self):
+        from zope.copy import copy
+        from plone.namedfile import copy as copy_module
+        from plone.namedfile.copy import BlobFileCopyHook
+        conn = self._openBlobConnection()
+
+        BlobFileCopyHook.share_blobs = True
+        self.addCleanup(setattr, BlobFileCopyHook, 'share_blobs', False)
+
+        source = NamedBlobFile(b'hello, world')
+        conn.root()['source'] = source
+        transaction.commit()
+        committed = source._blob.committed()
+        temp_dir = conn.db().storage.temporaryDirectory()
+        files = sorted(os.listdir(temp_dir))
+
+        # no hard links on the file system, the data is copied
+        def no_link(*args):
+            raise OSError(1, 'Operation not permitted')
+        link = os.link
+        os.link = no_link
+        self.addCleanup(setattr, os, 'link', link)
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+        assert_that(os.stat(file_copy._blob._p_blob_uncommitted).st_ino,
+                    is_not(os.stat(committed).st_ino))
+        assert_that(sorted(os.listdir(temp_dir)), is_(files))
+
+        # nor temporary files
+        class FailingTempfile(object):
+
+            @staticmethod
+            def mkstemp(*args, **kw):
+                raise OSError(13, 'Permission denied')
+
+        copy_module.tempfile = FailingTempfile
+        self.addCleanup(setattr, copy_module, 'tempfile', tempfile)
+        file_copy = copy(source)
+        assert_that(file_copy.data, is_(b'hello, world'))
+
+    def testParallelCopies(self):
+        from zope.copy import copy
+        from plone.namedfile.copy import BlobFileCopyHook
+        from plone.namedfile.copy import join_blob_copies
+        conn = self._openBlobConnection()
+
+        BlobFileCopyHook.copy_workers = 2
+        self.addCleanup(setattr, BlobFileCopyHook, 'copy_workers', None)
+
+        sources = [NamedBlobFile(b'file %d' % i) for i in range(5)]
+        conn.root()['sources'] = sources
+        transaction.commit()
+
+        copies = copy(sources)
+        conn.root()['copies'] = copies
+        transaction.commit()
+        assert_that([c.data for c in copies],
+                    is_([s.data for s in sources]))
+
+        copies = copy(sources)
+        join_blob_copies()
+        assert_that([c.data for c in copies],
+                    is_([s.data for s in sources]))
+        join_blob_copies()
+
+    def testDiscardParallelCopies(self):
+        from zope.copy import copy
+        from plone.namedfile.copy import _remove
+        from plone.namedfile.copy import BlobFileCopyHook
+        from plone.namedfile.copy import join_blob_copies
+        conn = self._openBlobConnection()
+
+        BlobFileCopyHook.copy_workers = 2
+        self.addCleanup(setattr, BlobFileCopyHook, 'copy_workers', None)
+
+        # nothing to join
+        transaction.begin()
+        join_blob_copies()
+
+        sources = [NamedBlobFile(b'file %d' % i) for i in range(5)]
+        conn.root()['sources'] = sources
+        transaction.commit()
+        temp_dir = conn.db().storage.temporaryDirectory()
+        files = sorted(os.listdir(temp_dir))
+
+        copies = copy(sources)
+        transaction.abort()
+        assert_that(sorted(os.listdir(temp_dir)), is_(files))
+        assert_that([c._blob._p_blob_uncommitted for c in copies],
+                    is_([None] * 5))
+
+        # removing files already gone
+        _remove(os.path.join(temp_dir, 'missing'))
+
+    @fudge.patch('plone.namedfile.copy.copy_file')
+    def testParallelCopyErrors(self, mock_copy):
+        from zope.copy import copy
+        from plone.namedfile.copy import BlobFileCopyHook
+        conn = self._openBlobConnection()
+
+        BlobFileCopyHook.copy_workers = 2
+        self.addCleanup(setattr, BlobFileCopyHook, 'copy_workers', None)
+
+        source = NamedBlobFile(b'hello, world')
+        conn.root()['source'] = source
+        transaction.commit()
+        blob_dir = os.path.dirname(source._blob.committed())
+        files = sorted(os.listdir(blob_dir))
+
+        mock_copy.is_callable().raises(IOError('disk full'))
+        conn.root()['copy'] = copy(source)
+        with self.assertRaises(IOError):
+            transaction.commit()
+        transaction.abort()
+        assert_that(sorted(os.listdir(blob_dir)), is_(files))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import io
+import os
+import hashlib
+import shutil
+import tempfile
+import unittest
+
+import transaction
+
+from ZODB import DB
+
+from ZODB.blob import BlobStorage
+
+from ZODB.MappingStorage import MappingStorage
+
+from zope import component
+
+from nti.testing.matchers import verifiably_provides
+
+from plone.namedfile.blobstore import ContentAddressedBlobStore
+
+from plone.namedfile.file import NamedBlobFile
+from plone.namedfile.file import NamedBlobImage
+
+from plone.namedfile.interfaces import IBlobStore
+
+from plone.namedfile.tests import getFile
+from plone.namedfile.tests import SharedConfiguringTestLayer
+
+
+class TestBlobStore(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def setUp(self):
+        self.store = ContentAddressedBlobStore()
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(self.store, IBlobStore)
+        self.addCleanup(gsm.unregisterUtility, self.store, IBlobStore)
+
+    def test_interface(self):
+        assert_that(self.store, verifiably_provides(IBlobStore))
+
+    def test_deduplicate(self):
+        data = getFile('image.gif')
+        digest = hashlib.sha256(data).hexdigest()
+        first = NamedBlobFile(data)
+        second = NamedBlobImage(io.BytesIO(data))
+        assert_that(first._blob_key, is_(digest))
+        assert_that(first._blob, same_instance(second._blob))
+        assert_that(self.store, has_length(1))
+        assert_that(self.store.refcounts[digest], is_(2))
+        assert_that(second.getImageSize(), is_((200, 200)))
+
+        # written files get a blob of their own
+        with first.open('a') as fp:
+            fp.write(b'!')
+        assert_that(first._blob, is_not(same_instance(second._blob)))
+        assert_that(first.data, is_(data + b'!'))
+        assert_that(second.data, is_(data))
+        assert_that(self.store.refcounts[digest], is_(1))
+
+        second.data = b'other'
+        assert_that(digest in self.store, is_(False))
+        assert_that(second.data, is_(b'other'))
+
+        first.data = b'other'
+        assert_that(first._blob, same_instance(second._blob))
+        assert_that(self.store, has_length(1))
+        assert_that(self.store.get(first._blob_key),
+                    same_instance(first._blob))
+        assert_that(self.store.get(digest), is_(none()))
+
+    def test_deduplicate_files(self):
+        data = getFile('image.gif')
+        fd, name = tempfile.mkstemp('.bin')
+        with io.open(fd, 'wb') as fp:
+            fp.write(data)
+        with io.open(name, 'rb') as fp:
+            image = NamedBlobImage(fp)
+        # named files are hashed and moved into the blob
+        assert_that(os.path.exists(name), is_(False))
+        assert_that(image._blob_key, is_(hashlib.sha256(data).hexdigest()))
+        assert_that(image.contentType, is_('image/gif'))
+        assert_that(NamedBlobFile(data)._blob, same_instance(image._blob))
+        assert_that(image.data, is_(data))
+
+    def test_algorithm(self):
+        store = ContentAddressedBlobStore('md5')
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(store, IBlobStore)
+        self.addCleanup(gsm.registerUtility, self.store, IBlobStore)
+
+        data = getFile('image.gif')
+        f = NamedBlobFile(data)
+        # keyed with the algorithm of the store whatever the class uses
+        assert_that(f._blob_key, is_(hashlib.md5(data).hexdigest()))
+        assert_that(store.get(f._blob_key), same_instance(f._blob))
+        assert_that(f._digest, is_(none()))
+        assert_that(f.getDigest(), is_(hashlib.sha256(data).hexdigest()))
+
+    def test_sweep(self):
+        files = [NamedBlobFile(b'data %d' % (i % 2)) for i in range(4)]
+        assert_that(self.store, has_length(2))
+        # the last files of each data are gone without releasing it
+        files = files[:1]
+        assert_that(self.store.sweep(f._blob_key for f in files), is_(1))
+        assert_that(self.store, has_length(1))
+        assert_that(self.store.refcounts[files[0]._blob_key], is_(1))
+
+    def test_commit_and_copy(self):
+        from zope.copy import copy
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        self.addCleanup(db.close)
+        conn = db.open()
+        self.addCleanup(conn.close)
+        self.addCleanup(transaction.abort)
+
+        conn.root()['store'] = self.store
+        conn.root()['first'] = first = NamedBlobFile(b'hello, world')
+        conn.root()['second'] = NamedBlobFile(b'hello, world')
+        transaction.commit()
+
+        file_copy = copy(first)
+        assert_that(file_copy._blob, same_instance(first._blob))
+        assert_that(self.store.refcounts[first._blob_key], is_(3))
+
+        self.store.release(first._blob_key)
+        component.getGlobalSiteManager().unregisterUtility(self.store,
+                                                           IBlobStore)
+        file_copy = copy(first)
+        assert_that(file_copy._blob_key, is_(none()))
+        assert_that(file_copy.data, is_(b'hello, world'))
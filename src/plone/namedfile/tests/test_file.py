@@ -8,24 +8,54 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods
 
 from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_entry
+from hamcrest import has_key
+from hamcrest import has_length
 from hamcrest import assert_that
 from hamcrest import has_property
 
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
 import fudge
 
+import transaction
+
+from ZODB import DB
+
 from ZODB.blob import BlobError
+from ZODB.blob import BlobStorage
+
+from ZODB.MappingStorage import MappingStorage
 
 from plone.namedfile.file import MAXCHUNKSIZE
+from plone.namedfile.file import IMAGE_INFO_BYTES
+from plone.namedfile.file import ADAPTIVE_CHUNKS
+from plone.namedfile.file import MAX_ADAPTIVE_CHUNKSIZE
 
 from plone.namedfile.file import FileChunk
+from plone.namedfile.file import chunks_size
+from plone.namedfile.file import FileChunkReader
+from plone.namedfile.file import adaptive_chunk_size
 from plone.namedfile.file import NamedFile
 from plone.namedfile.file import NamedImage
 from plone.namedfile.file import NamedBlobFile
 from plone.namedfile.file import NamedBlobImage
 
+from plone.namedfile.file import EXIF_FULL
+from plone.namedfile.file import EXIF_SUMMARY
+from plone.namedfile.file import ORIENTATION_RECORD
+
+from plone.namedfile.utils import get_exif
+from plone.namedfile.utils import get_orientation
+from plone.namedfile.utils import register_contenttype
+from plone.namedfile.utils import ImageAnalysis
+
 from plone.namedfile.tests import getFile
 from plone.namedfile.tests import SharedConfiguringTestLayer
 
@@ -53,6 +83,7 @@ class TestFile(unittest.TestCase):
 
         fc.next = FileChunk(b'catalog')
         assert_that(bytes(fc), is_(b'zopecatalog'))
+        assert_that(len(fc), is_(11))
 
     def test_fileio(self):
         source = self._makeFile(filename=u'zptlogo.gif')
@@ -80,6 +111,241 @@ class TestFile(unittest.TestCase):
         source._setData(fileio)
         assert_that(source.getSize(), is_(MAXCHUNKSIZE * 3))
 
+    def test_iterchunks(self):
+        source = self._makeFile()
+        assert_that(list(source.iterchunks()), is_([]))
+
+        source._setData(b'zope')
+        assert_that(list(source.iterchunks()), is_([b'zope']))
+
+        fc = FileChunk(b'zope')
+        fc.next = FileChunk(b'')
+        fc.next.next = FileChunk(b'catalog')
+        source._setData(fc)
+        assert_that(list(source.iterchunks()), is_([b'zope', b'catalog']))
+
+        # small file objects are kept as raw bytes
+        source._setData(io.BytesIO(b'zope'))
+        assert_that(source._data, is_(b'zope'))
+        assert_that(list(source.iterchunks()), is_([b'zope']))
+
+        source._setData(io.BytesIO(b''))
+        assert_that(source._data, is_(b''))
+        assert_that(list(source.iterchunks()), is_([]))
+
+    def test_iterchunks_ghosts(self):
+        db = DB(None)
+        conn = db.open()
+        try:
+            source = self._makeFile()
+            conn.root()['file'] = source
+            data = b'a' * MAXCHUNKSIZE + b'b' * MAXCHUNKSIZE * 2
+            source._setData(io.BytesIO(data))
+            transaction.commit()
+
+            chunks = []
+            for chunk in source.iterchunks():
+                chunks.append(chunk)
+            assert_that(b''.join(chunks), is_(data))
+            assert_that(source._data._p_status, is_('ghost'))
+            assert_that(source._data.next._p_status, is_('ghost'))
+
+            # chains built by the file know their size
+            assert_that(source._data._size, is_(len(data)))
+            assert_that(chunks_size(source._data.next),
+                        is_(len(data) - MAXCHUNKSIZE))
+
+            target = self._makeFile()
+            target._setData(source._data)
+            assert_that(target.getSize(), is_(len(data)))
+        finally:
+            transaction.abort()
+            conn.close()
+            db.close()
+
+    def test_filechunk_reader(self):
+        fc = FileChunk(b'zope')
+        fc.next = FileChunk(b'')
+        fc.next.next = FileChunk(b'catalog')
+        reader = FileChunkReader(fc)
+        assert_that(reader.read(2), is_(b'zo'))
+        assert_that(reader.read(4), is_(b'peca'))
+        assert_that(reader.read(), is_(b'talog'))
+        assert_that(reader.read(), is_(b''))
+
+        assert_that(reader.seek(3), is_(3))
+        assert_that(reader.read(3), is_(b'eca'))
+        assert_that(reader.seek(-2, io.SEEK_END), is_(9))
+        assert_that(reader.read(), is_(b'og'))
+        reader.seek(-4, io.SEEK_CUR)
+        assert_that(reader.tell(), is_(7))
+        assert_that(reader.read(1), is_(b'a'))
+        reader.seek(20)
+        assert_that(reader.read(1), is_(b''))
+
+        with self.assertRaises(ValueError):
+            reader.seek(-1)
+        with self.assertRaises(ValueError):
+            reader.seek(0, 3)
+
+        source = self._makeFile(fc)
+        with source.open() as fp:
+            fp.seek(4)
+            assert_that(fp.read(), is_(b'catalog'))
+
+        source._setData(io.BytesIO(b'zope'))
+        with source.open() as fp:
+            assert_that(fp.read(), is_(b'zope'))
+
+        with self.assertRaises(ValueError):
+            source.open('w')
+
+    def test_filechunk_reader_range(self):
+        db = DB(None)
+        conn = db.open()
+        try:
+            source = self._makeFile()
+            conn.root()['file'] = source
+            data = b'a' * MAXCHUNKSIZE * 2 + b'b' * MAXCHUNKSIZE * 2
+            source._setData(io.BytesIO(data))
+            transaction.commit()
+            conn.cacheMinimize()
+
+            reader = FileChunkReader(source._data)
+            reader.seek(MAXCHUNKSIZE * 2 - 1)
+            assert_that(reader.read(2), is_(b'ab'))
+            # the last chunk is known but was never loaded
+            assert_that(reader._chunks, has_length(4))
+            assert_that(source._data.next.next.next._p_status, is_('ghost'))
+            assert_that(reader.seek(0, io.SEEK_END), is_(len(data)))
+        finally:
+            transaction.abort()
+            conn.close()
+            db.close()
+
+    def test_filechunk_reader_loads(self):
+        db = DB(None)
+        conn = db.open()
+        try:
+            source = self._makeFile()
+            conn.root()['file'] = source
+            data = b''.join(b'%02d' % i * (MAXCHUNKSIZE // 2)
+                            for i in range(20))
+            source._setData(io.BytesIO(data), adaptive=False)
+            transaction.commit()
+
+            def loads(func):
+                conn.cacheMinimize()
+                count = conn._load_count
+                assert_that(func(), is_(data))
+                return conn._load_count - count
+
+            walked = loads(lambda: b''.join(source.iterchunks()))
+            assert_that(walked, is_(21))
+            # every chunk is loaded once
+            assert_that(loads(lambda: source.open().read()), is_(walked))
+
+            def read_range():
+                with source.open() as fp:
+                    fp.seek(MAXCHUNKSIZE * 10)
+                    return data[:MAXCHUNKSIZE * 10] + fp.read()
+            # and chunks before the range only to walk past them
+            assert_that(loads(read_range), is_(walked))
+        finally:
+            transaction.abort()
+            conn.close()
+            db.close()
+
+    def test_legacy_size(self):
+        # stored by a previous version, without the sizes
+        fc = FileChunk(b'zope')
+        fc.next = FileChunk(b'catalog')
+        source = self._makeFile(fc)
+        del source._size
+        assert_that(source.getSize(), is_(11))
+
+        # read from the first chunk of chains without walking them
+        fc._size = 11
+        fc.next = None
+        assert_that(source.getSize(), is_(11))
+
+    def test_adaptive_chunk_size(self):
+        assert_that(adaptive_chunk_size(0), is_(MAXCHUNKSIZE))
+        assert_that(adaptive_chunk_size(MAXCHUNKSIZE * ADAPTIVE_CHUNKS),
+                    is_(MAXCHUNKSIZE))
+        assert_that(adaptive_chunk_size(MAXCHUNKSIZE * ADAPTIVE_CHUNKS + 1),
+                    is_(MAXCHUNKSIZE * 2))
+        assert_that(adaptive_chunk_size(1 << 40),
+                    is_(MAX_ADAPTIVE_CHUNKSIZE))
+        assert_that(adaptive_chunk_size(1 << 40, maximum=100),
+                    is_(MAXCHUNKSIZE))
+
+    def test_chunk_size(self):
+        db = DB(None)
+        conn = db.open()
+        try:
+            source = self._makeFile()
+            conn.root()['file'] = source
+            data = b'a' * 1024 * 10
+            source._setData(io.BytesIO(data), chunk_size=1024)
+            assert_that(source.data, is_(data))
+            assert_that(len(list(source.iterchunks())), is_(10))
+
+            source.chunk_size = 2048
+            source._setData(io.BytesIO(data))
+            assert_that(source.data, is_(data))
+            assert_that(len(list(source.iterchunks())), is_(5))
+
+            source._setData(io.BytesIO(data), chunk_size=1024, adaptive=True)
+            assert_that(len(list(source.iterchunks())), is_(10))
+
+            # 1.25MB split in 16KB chunks
+            source.adaptive_chunks = True
+            source._setData(io.BytesIO(data * ADAPTIVE_CHUNKS))
+            assert_that(len(list(source.iterchunks())), is_(80))
+        finally:
+            transaction.abort()
+            conn.close()
+            db.close()
+
+    @fudge.patch('transaction.savepoint')
+    def test_savepoint_batches(self, mock_sp):
+        savepoints = []
+        savepoint = transaction.manager.savepoint
+
+        def _savepoint(optimistic=False):
+            savepoints.append(optimistic)
+            return savepoint(optimistic)
+        mock_sp.is_callable().calls(_savepoint)
+
+        db = DB(None)
+        conn = db.open()
+        try:
+            source = self._makeFile()
+            conn.root()['file'] = source
+            data = b'a' * 1024 * 10
+            source._setData(io.BytesIO(data), chunk_size=1024)
+            assert_that(savepoints, has_length(11))
+
+            del savepoints[:]
+            source.savepoint_chunks = 4
+            source._setData(io.BytesIO(data), chunk_size=1024)
+            assert_that(savepoints, has_length(4))
+
+            del savepoints[:]
+            source.savepoint_chunks = None
+            source.savepoint_bytes = 1024 * 5
+            source._setData(io.BytesIO(data), chunk_size=1024)
+            assert_that(savepoints, has_length(3))
+            assert_that(source._data._p_status, is_('ghost'))
+            assert_that(source.data, is_(data))
+            transaction.commit()
+            assert_that(source.data, is_(data))
+        finally:
+            transaction.abort()
+            conn.close()
+            db.close()
+
     def test_coverage_file(self):
         source = self._makeFile()
         source._data = b'zope'
@@ -97,15 +363,38 @@ class TestFile(unittest.TestCase):
         assert_that(source,
                     has_property('data', is_(b'zope')))
 
-    @fudge.patch('plone.namedfile.file.get_exif')
-    def test_exif(self, mock_ge):
+    @fudge.patch('plone.namedfile.file.analyze_image')
+    def test_exif(self, mock_ai):
         import piexif
-        mock_ge.is_callable().returns(
-            {'0th': {piexif.ImageIFD.Orientation: 2}}
+        exif = {'0th': {piexif.ImageIFD.Orientation: 2}}
+        mock_ai.is_callable().returns(
+            ImageAnalysis('image/jpeg', 500, 200, 2, exif)
         )
         data = getFile('sample.jpg')
         image = self._makeImage(data=data)
         assert_that(image.getImageSize(), is_((500, 200)))
+        assert_that(image, has_property('exif', has_key('0th')))
+
+    def test_image_analysis(self):
+        data = getFile('exif.jpg')
+        image = self._makeImage(data=data)
+        assert_that(image.contentType, is_('image/jpeg'))
+        assert_that(image.getImageSize(), is_((480, 360)))
+        assert_that(image.exif_data, has_key('0th'))
+
+        info = image._setImageData(data, exif=True)
+        assert_that(info.orientation, is_(1))
+        assert_that(info.exif, has_key('0th'))
+
+        # stored by earlier versions
+        image.exif_data = {'0th': {}}
+        assert_that(image.exif_data, is_({'0th': {}}))
+        image._setData(data)
+        assert_that(image.exif_data, is_(get_exif(data)))
+
+        image._setData(getFile('zptlogo.gif'))
+        assert_that(image.contentType, is_('image/gif'))
+        assert_that(image.getImageSize(), is_((1536, 532)))
 
     def test_blob_file(self):
         source = self._makeBlobFile(data=b'zope')
@@ -128,23 +417,242 @@ class TestFile(unittest.TestCase):
         assert_that(source,
                     has_property('size', is_(5)))
 
-    @fudge.patch('plone.namedfile.file.get_exif')
-    def test_blob_image(self, mock_ge):
-        import piexif
-        mock_ge.is_callable().returns(
-            {'0th': {piexif.ImageIFD.Orientation: 2}}
-        )
+    def test_digest(self):
+        import hashlib
+        data = b'a' * MAXCHUNKSIZE * 3
+        digest = hashlib.sha256(data).hexdigest()
+        chunk = FileChunk(data[:MAXCHUNKSIZE])
+        chunk.next = FileChunk(data[MAXCHUNKSIZE:])
+        chunk._size = len(data)
+        sources = (data, io.BytesIO(data), chunk, [data])
+        for factory, source in zip((self._makeFile, self._makeFile,
+                                    self._makeFile, self._makeBlobFile),
+                                   sources):
+            # computed when first asked for, then stored
+            f = factory(data=source)
+            assert_that(f._digest, is_(none()))
+            assert_that(f.getDigest(), is_(digest))
+            assert_that(f._digest, is_(digest))
+
+        f = self._makeFile(data=data)
+        assert_that(f.getDigest(), is_(digest))
+        f.data = b'zope'
+        assert_that(f._digest, is_(none()))
+        assert_that(f.getDigest(), is_(hashlib.sha256(b'zope').hexdigest()))
+
+        f = self._makeBlobFile(data=io.BytesIO(data))
+        assert_that(f.getDigest(), is_(digest))
+        with f.open('a') as fp:
+            fp.write(b'b')
+        assert_that(f._digest, is_(none()))
+        assert_that(f.getDigest(),
+                    is_(hashlib.sha256(data + b'b').hexdigest()))
+
+        class MD5File(NamedBlobFile):
+            digest_algorithm = 'md5'
+
+        class NoDigestFile(NamedFile):
+            digest_algorithm = None
+
+        assert_that(MD5File(b'zope').getDigest(),
+                    is_(hashlib.md5(b'zope').hexdigest()))
+        assert_that(NoDigestFile(b'zope').getDigest(), is_(none()))
+
+    def test_sniff_contenttype(self):
+        # not known to the mimetypes of every python version
+        for extension, content_type in (('avif', 'image/avif'),
+                                        ('heic', 'image/heic'),
+                                        ('cr2', 'image/x-canon-cr2')):
+            register_contenttype(extension, content_type)
+            self.addCleanup(register_contenttype, extension, None)
+        data = b'%PDF-1.4\n' + b'a' * MAXCHUNKSIZE * 2
+        for factory in (self._makeFile, self._makeBlobFile):
+            for source in (data, io.BytesIO(data)):
+                f = factory(data=source, filename=u'report')
+                assert_that(f.contentType, is_('application/pdf'))
+            f = factory(data=data, contentType='text/plain')
+            assert_that(f.contentType, is_('text/plain'))
+            f = factory(data=getFile('notimage.doc'),
+                        filename=u'notimage.doc')
+            assert_that(f.contentType, is_('application/msword'))
+            # formats of other brands keep the type of their file name
+            for brand, filename, content_type in (
+                    (b'avif', u'photo.avif', 'image/avif'),
+                    (b'heix', u'photo.heic', 'image/heic'),
+                    (b'crx ', u'photo.heic', 'image/heic')):
+                f = factory(data=b'\x00\x00\x00\x18ftyp' + brand + b'\x00',
+                            filename=filename)
+                assert_that(f.contentType, is_(content_type))
+            f = factory(data=b'II*\x00\x10\x00\x00\x00CR\x02\x00',
+                        filename=u'photo.cr2')
+            assert_that(f.contentType, is_('image/x-canon-cr2'))
+            f = factory(data=b'%PDF-1.4\n', filename=u'drawing.ai')
+            assert_that(f.contentType, is_('application/postscript'))
+            # other formats override the type of the file name
+            f = factory(data=getFile('image.gif'), filename=u'image.jpg')
+            assert_that(f.contentType, is_('image/gif'))
+
+        class NoDigestFile(NamedBlobFile):
+            digest_algorithm = None
+
+        f = NoDigestFile(data=data)
+        assert_that(f.contentType, is_('application/pdf'))
+
+        # consumed files are sniffed as they are hashed
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, 'report')
+        with open(filename, 'wb') as fp:
+            fp.write(data)
+        with open(filename, 'rb') as fp:
+            f = self._makeBlobFile(data=fp)
+        assert_that(f.contentType, is_('application/pdf'))
+        assert_that(f.getSize(), is_(len(data)))
+
+    def test_blob_file_size(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        self.addCleanup(db.close)
+        conn = db.open()
+        try:
+            source = self._makeBlobFile(data=b'zope')
+            conn.root()['file'] = source
+            transaction.commit()
+
+            conn.cacheMinimize()
+            assert_that(source._p_changed, is_(none()))
+
+            def fail(*args):  # pragma: no cover
+                raise AssertionError("blob opened")
+            source._blob.open = fail
+            assert_that(source.getSize(), is_(4))
+            del source._blob.open
+
+            with source.open('w') as fp:
+                fp.write(b'catalog')
+            assert_that(source._size, is_(none()))
+            assert_that(source.getSize(), is_(7))
+            transaction.commit()
+
+            # stored by a previous version without its size
+            conn.cacheMinimize()
+            assert_that(source.getSize(), is_(7))
+            assert_that(source.__dict__, has_key('_v_size'))
+        finally:
+            transaction.abort()
+            conn.close()
+
+    @fudge.patch('plone.namedfile.file.analyze_image')
+    def test_blob_image(self, mock_ai):
+        mock_ai.is_callable().returns(
+            ImageAnalysis('image/png', 1536, 532, 2, None))
         data = getFile('zptlogo.gif')
         image = self._makeBlobImage(contentType='image/gif', data=data)
         assert_that(image,
                     has_property('contentType', is_('image/gif')))
-        
-        mock_ge.is_callable().returns(
-            {'0th': {}}
-        )
+
+    def test_blob_image_opens(self):
+        from ZODB.blob import Blob
+        blob_open = Blob.open
+        opens = []
+
+        def counting_open(blob, mode='r'):
+            opens.append(mode)
+            return blob_open(blob, mode)
+        Blob.open = counting_open
+        self.addCleanup(setattr, Blob, 'open', blob_open)
+
+        image = self._makeBlobImage(data=getFile('exif.jpg'))
+        assert_that(opens, is_(['w', 'r']))
+        assert_that(image.getSize(), is_(len(getFile('exif.jpg'))))
+        assert_that(image.getImageSize(), is_not((-1, -1)))
+        assert_that(opens, has_length(2))
+
+    def test_blob_image_size(self):
         data = getFile('zptlogo.gif')
         image = self._makeBlobImage(contentType=b'image/gif', data=data)
         assert_that(image.getImageSize(), is_((1536, 532)))
 
+        # unknown dimensions are not looked for again
         image._width, image._height = (-1, -1)
+        assert_that(image.getImageSize(), is_((-1, -1)))
+
+        # stored by a previous version
+        image._sniffed = False
         assert_that(image.getImageSize(), is_((1536, 532)))
+        assert_that(image._sniffed, is_(True))
+
+    def test_blob_image_first_bytes(self):
+        data = getFile('image.gif')
+        image = self._makeBlobImage(data=data)
+        assert_that(image.getFirstBytes(), is_(data))
+        assert_that(image.getFirstBytes(6, 4), is_(data[6:10]))
+
+        data = b'\x00' * (IMAGE_INFO_BYTES * 2)
+        image = self._makeBlobImage(data=data)
+        assert_that(image.getFirstBytes(), has_length(IMAGE_INFO_BYTES))
+
+    def test_image_rotation(self):
+        import piexif
+        exif = {'0th': {piexif.ImageIFD.Orientation: 6}}
+        data = io.BytesIO()
+        piexif.insert(piexif.dump(exif), getFile('sample.jpg'), data)
+        data = data.getvalue()
+
+        for factory in (self._makeImage, self._makeBlobImage):
+            image = factory(data=data)
+            assert_that(image.getImageSize(), is_((200, 500)))
+            assert_that(get_orientation(image.data), is_(1))
+            assert_that(image.orientation, is_(1))
+
+        class Recording(object):
+            orientation_mode = ORIENTATION_RECORD
+
+        for factory in (NamedImage, NamedBlobImage):
+            factory = type('Recording' + factory.__name__,
+                           (Recording, factory), {})
+            image = factory(data=data)
+            assert_that(image.data, is_(data))
+            assert_that(image.getImageSize(), is_((500, 200)))
+            assert_that(image.orientation, is_(6))
+
+            image._setData(getFile('sample.jpg'))
+            assert_that(image.orientation, is_(1))
+
+            # recorded for new data as well
+            image = factory(data=getFile('sample.jpg'))
+            image.data = data
+            assert_that(image.data, is_(data))
+            assert_that(image.orientation, is_(6))
+
+    def test_blob_image_exif(self):
+        import piexif
+        data = getFile('exif.jpg')
+        image = self._makeBlobImage(data=data)
+        assert_that(image.__dict__, is_not(has_key('exif')))
+        assert_that(image.exif_summary, is_(none()))
+        assert_that(image.exif, is_(get_exif(data)))
+
+        # parsed again once the volatile attributes are gone
+        del image._v_exif
+        assert_that(image.exif, is_(get_exif(data)))
+
+        image.exif_storage = EXIF_SUMMARY
+        image._setData(data)
+        assert_that(image.__dict__, is_not(has_key('exif')))
+        assert_that(image.exif_summary,
+                    has_entry('0th',
+                              has_entry(piexif.ImageIFD.Orientation, 1)))
+        assert_that(image.exif_summary['0th'], is_not(has_key(
+            piexif.ImageIFD.Make)))
+
+        image.exif_storage = EXIF_FULL
+        image._setData(data)
+        assert_that(image.__dict__, has_key('exif'))
+        assert_that(image.exif_summary, is_(none()))
+        del image._v_exif
+        assert_that(image.exif, is_(get_exif(data)))
+
+        image._setData(getFile('zptlogo.gif'))
+        assert_that(image.exif, is_(none()))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# pylint: disable=protected-access,too-many-public-methods
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_length
+from hamcrest import assert_that
+
+import io
+import shutil
+import tempfile
+import unittest
+
+import fudge
+
+import transaction
+
+from ZODB import DB
+
+from ZODB.blob import BlobStorage
+
+from ZODB.MappingStorage import MappingStorage
+
+from zope import component
+
+from plone.namedfile.file import NamedBlobImage
+from plone.namedfile.file import ORIENTATION_DEFER
+
+from plone.namedfile.interfaces import IImageNormalizationQueue
+
+from plone.namedfile.normalization import LocalNormalizationQueue
+from plone.namedfile.normalization import AfterCommitNormalizationQueue
+
+from plone.namedfile.utils import get_orientation
+
+from plone.namedfile.tests import getFile
+from plone.namedfile.tests import SharedConfiguringTestLayer
+
+
+class DeferredBlobImage(NamedBlobImage):
+    orientation_mode = ORIENTATION_DEFER
+
+
+class FailingBlobImage(DeferredBlobImage):
+
+    def normalizeOrientation(self, orientation=None):
+        raise ValueError('broken image')
+
+
+def rotated_jpeg():
+    import piexif
+    exif = {'0th': {piexif.ImageIFD.Orientation: 6}}
+    data = io.BytesIO()
+    piexif.insert(piexif.dump(exif), getFile('sample.jpg'), data)
+    return data.getvalue()
+
+
+class TestNormalization(unittest.TestCase):
+
+    layer = SharedConfiguringTestLayer
+
+    def _register(self, queue):
+        gsm = component.getGlobalSiteManager()
+        gsm.registerUtility(queue, IImageNormalizationQueue)
+        self.addCleanup(gsm.unregisterUtility, queue,
+                        IImageNormalizationQueue)
+        return queue
+
+    def test_deferred_without_queue(self):
+        data = rotated_jpeg()
+        image = DeferredBlobImage(data)
+        assert_that(image.data, is_(data))
+        assert_that(image.orientation, is_(6))
+        assert_that(image.getImageSize(), is_((500, 200)))
+
+    def test_local_queue(self):
+        queue = self._register(LocalNormalizationQueue())
+        data = rotated_jpeg()
+        image = DeferredBlobImage(data)
+        assert_that(queue.images, has_length(1))
+        assert_that(image.data, is_(data))
+        assert_that(image.orientation, is_(6))
+
+        assert_that(queue.process(), is_(1))
+        assert_that(queue.images, has_length(0))
+        assert_that(image.orientation, is_(1))
+        assert_that(image.getImageSize(), is_((200, 500)))
+        assert_that(get_orientation(image.data), is_(1))
+
+        # normalized images are left alone
+        assert_that(image.normalizeOrientation(), is_(False))
+
+        # images without an orientation are not scheduled
+        DeferredBlobImage(getFile('sample.jpg'))
+        assert_that(queue.images, has_length(0))
+
+        # but normalized ones given new rotated data are
+        image.data = data
+        assert_that(image.orientation, is_(6))
+        assert_that(queue.images, has_length(1))
+        assert_that(queue.process(), is_(1))
+        assert_that(image.orientation, is_(1))
+
+    def test_after_commit_queue(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        self.addCleanup(db.close)
+
+        queue = self._register(AfterCommitNormalizationQueue())
+        conn = db.open()
+        try:
+            image = DeferredBlobImage(rotated_jpeg())
+            conn.root()['image'] = image
+            transaction.abort()
+            queue.executor.submit(lambda: None).result()
+            assert_that(image.orientation, is_(6))
+
+            image = DeferredBlobImage(rotated_jpeg())
+            conn.root()['image'] = image
+            transaction.commit()
+        finally:
+            queue.shutdown()
+
+        transaction.begin()
+        assert_that(image.orientation, is_(1))
+        assert_that(image.getImageSize(), is_((200, 500)))
+        conn.close()
+
+    @fudge.patch('plone.namedfile.normalization.logger')
+    def test_normalize_errors(self, mock_logger):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        db = DB(BlobStorage(tmpdir, MappingStorage()))
+        self.addCleanup(db.close)
+        conn = db.open()
+        conn.root()['image'] = image = FailingBlobImage(rotated_jpeg())
+        transaction.commit()
+        oid = image._p_oid
+        conn.close()
+
+        opened = []
+        db_open = db.open
+
+        def record(*args, **kw):
+            opened.append(db_open(*args, **kw))
+            return opened[-1]
+        db.open = record
+
+        mock_logger.expects('exception').with_arg_count(2)
+        queue = AfterCommitNormalizationQueue()
+        self.addCleanup(queue.shutdown)
+        queue.normalize(db, oid)
+        assert_that(opened, has_length(1))
+        assert_that(opened[0].opened, is_(none()))
@@ -8,8 +8,10 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods
 
 from hamcrest import is_
+from hamcrest import has_length
 from hamcrest import assert_that
 
+import io
 import os
 import tempfile
 import unittest
@@ -17,12 +19,14 @@ import unittest
 from ZODB.blob import Blob
 
 from plone.namedfile.file import FileChunk
+from plone.namedfile.file import NamedBlobFile
 from plone.namedfile.file import NamedBlobImage
 
 from plone.namedfile.interfaces import NotStorable
 
 from plone.namedfile.storages import BinaryStorable
 from plone.namedfile.storages import UnicodeStorable
+from plone.namedfile.storages import IterableStorable
 from plone.namedfile.storages import FileChunkStorable
 from plone.namedfile.storages import FileDescriptorStorable
 
@@ -53,6 +57,85 @@ class TestStorable(unittest.TestCase):
             FileDescriptorStorable().store(fp, blob)
         assert_that(os.path.exists(name), is_(False))
         
+    def test_stream_storable(self):
+        data = getFile('image.gif')
+        for source in (io.BytesIO(data),
+                       io.BufferedReader(io.BytesIO(data))):
+            fi = NamedBlobImage(source, filename=u'image.gif')
+            assert_that(fi._size, is_(303))
+            assert_that(fi.data, is_(data))
+
+        fi = NamedBlobFile(io.StringIO(u'caf\xe9'))
+        assert_that(fi.data, is_(u'caf\xe9'.encode('utf-8')))
+
+        # copied from the current position, through a small buffer
+        storable = FileDescriptorStorable()
+        storable.buffer_size = 7
+        source = io.BytesIO(data)
+        source.seek(3)
+        blob = Blob()
+        assert_that(storable.store(source, blob), is_(300))
+        with blob.open('r') as fp:
+            assert_that(fp.read(), is_(data[3:]))
+
+    def test_temporary_file_storable(self):
+        from plone.namedfile.utils import io_utils
+        copies = []
+        kernel_copy = io_utils._kernel_copy
+
+        def record(*args):
+            copies.append(args)
+            return kernel_copy(*args)
+        io_utils._kernel_copy = record
+        self.addCleanup(setattr, io_utils, '_kernel_copy', kernel_copy)
+
+        data = getFile('image.gif')
+        with tempfile.TemporaryFile() as source:
+            source.write(data)
+            source.seek(0)
+            # buffered ahead of the position handed to the kernel
+            assert_that(source.read(3), is_(data[:3]))
+            fi = NamedBlobFile(source)
+            assert_that(source.read(), is_(b''))
+        assert_that(fi._size, is_(300))
+        assert_that(fi.data, is_(data[3:]))
+        # files are copied by the kernel unless hashed for a blob store
+        assert_that(copies, has_length(1))
+
+    def test_pipe_storable(self):
+        data = getFile('image.gif')
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, data)
+        os.close(write_fd)
+        with io.open(read_fd, 'rb') as source:
+            fi = NamedBlobFile(source)
+        assert_that(fi.data, is_(data))
+
+    def test_iterable_storable(self):
+        data = getFile('image.gif')
+
+        def chunks():
+            for i in range(0, len(data), 100):
+                yield data[i:i + 100]
+
+        for source in (chunks(), list(chunks()), iter(list(chunks()))):
+            fi = NamedBlobImage(source, filename=u'image.gif')
+            assert_that(fi._size, is_(303))
+            assert_that(fi.data, is_(data))
+            assert_that(fi.getImageSize(), is_((200, 200)))
+
+        blob = Blob()
+        assert_that(IterableStorable().store([u'caf\xe9', b'!'], blob),
+                    is_(6))
+        with blob.open('r') as fp:
+            assert_that(fp.read(), is_(u'caf\xe9!'.encode('utf-8')))
+
+    def test_stored_size(self):
+        fi = NamedBlobFile(b'catalog')
+        assert_that(fi._size, is_(7))
+        fi = NamedBlobFile(FileChunk(b'index'))
+        assert_that(fi._size, is_(5))
+
     def test_coverage(self):
         with self.assertRaises(NotStorable):
             BinaryStorable().store(u'data', None)
@@ -65,3 +148,9 @@ class TestStorable(unittest.TestCase):
             
         with self.assertRaises(NotStorable):
             FileDescriptorStorable().store(u'data', None)
+
+        with self.assertRaises(NotStorable):
+            IterableStorable().store(b'data', None)
+
+        with self.assertRaises(NotStorable):
+            IterableStorable().store(42, None)
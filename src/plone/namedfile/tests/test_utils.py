@@ -8,11 +8,21 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods
 
 from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_key
 from hamcrest import has_length
+from hamcrest import less_than
 from hamcrest import assert_that
 from hamcrest import has_entries
+from hamcrest import has_properties
 
+import io
+import os
+import errno
+import struct
+import tempfile
 import unittest
+from io import BytesIO
 from six import StringIO
 
 import fudge
@@ -23,11 +33,23 @@ from plone.namedfile.tests import getFile
 from plone.namedfile.tests import SharedConfiguringTestLayer
 
 from plone.namedfile.utils import get_exif
+from plone.namedfile.utils import read_exif
+from plone.namedfile.utils import get_exif_summary
+from plone.namedfile.utils import analyze_image
+from plone.namedfile.utils import get_orientation
 from plone.namedfile.utils import ensure_data
 from plone.namedfile.utils import getImageInfo
 from plone.namedfile.utils import rotate_image
 from plone.namedfile.utils import safe_basename
 from plone.namedfile.utils import get_contenttype
+from plone.namedfile.utils import guess_contenttype
+from plone.namedfile.utils import sniff_contenttype
+from plone.namedfile.utils import register_contenttype
+
+from plone.namedfile.utils.io_utils import copy_stream
+from plone.namedfile.utils.io_utils import copy_fd_stream
+from plone.namedfile.utils.io_utils import HashingWriter
+from plone.namedfile.utils.io_utils import WindowedReader
 
 from plone.namedfile.utils.jpeg_utils import process_jpeg
 
@@ -36,6 +58,17 @@ from plone.namedfile.utils.png_utils import process_png
 from plone.namedfile.utils.tiff_utils import process_tiff
 
 
+class _CountingIO(BytesIO):
+
+    count = reads = 0
+
+    def read(self, size=-1):
+        data = BytesIO.read(self, size)
+        self.count += len(data)
+        self.reads += 1
+        return data
+
+
 class TestUtils(unittest.TestCase):
 
     layer = SharedConfiguringTestLayer
@@ -54,6 +87,88 @@ class TestUtils(unittest.TestCase):
         assert_that(get_contenttype(),
                     is_('application/octet-stream'))
 
+        import mimetypes
+        for filename in ('report.pdf', 'REPORT.PDF', 'image.JPEG', 'x.tgz',
+                         'archive.tar.gz', 'page.html.br', 'README',
+                         'data:text/plain,x', 'x.unknown', 'C:\\a.b\\c'):
+            assert_that(guess_contenttype(filename),
+                        is_(mimetypes.guess_type(filename)[0]))
+        assert_that(get_contenttype(filename=u'x.unknown'),
+                    is_('application/octet-stream'))
+
+        register_contenttype('PDF', 'application/x-pdf')
+        self.addCleanup(register_contenttype, 'pdf', None)
+        assert_that(get_contenttype(filename=u'report.Pdf'),
+                    is_('application/x-pdf'))
+
+    def test_guess_contenttype_cache(self):
+        from plone.namedfile.utils import contenttype_utils
+        self.addCleanup(setattr, contenttype_utils, 'CONTENTTYPE_CACHE_SIZE',
+                        contenttype_utils.CONTENTTYPE_CACHE_SIZE)
+        self.addCleanup(contenttype_utils._guessed.clear)
+        contenttype_utils._guessed.clear()
+        contenttype_utils.CONTENTTYPE_CACHE_SIZE = 2
+
+        # names that do not reduce to their extensions are guessed whole
+        import mimetypes
+        for filename in ('files/data:x.tar:v2.gz', 'files/.tar.gz'):
+            assert_that(guess_contenttype(filename),
+                        is_(mimetypes.guess_type(filename)[0]))
+            assert_that(contenttype_utils._guessed, has_key(filename))
+
+        # the least recently used name is evicted
+        guess_contenttype('files/data:x.tar:v2.gz')
+        assert_that(guess_contenttype('archive.tar.gz'),
+                    is_('application/x-tar'))
+        assert_that(list(contenttype_utils._guessed),
+                    is_(['files/data:x.tar:v2.gz', 'x.tar.gz']))
+
+    def test_sniff_contenttype(self):
+        assert_that(sniff_contenttype(b'%PDF-1.4\n'),
+                    is_('application/pdf'))
+        assert_that(sniff_contenttype(b'%PDF-1.4\n', 'application/postscript'),
+                    is_('application/postscript'))
+        assert_that(sniff_contenttype(b'\x00\x00\x00\x18ftypmp42'),
+                    is_('video/mp4'))
+        assert_that(sniff_contenttype(b'\x1aE\xdf\xa3\x9fB\x82\x84webm'),
+                    is_('video/webm'))
+        assert_that(sniff_contenttype(b'ID3\x04\x00'),
+                    is_('audio/mpeg'))
+        assert_that(sniff_contenttype(b'RIFF\x00\x00\x00\x00WEBPVP8 '),
+                    is_('image/webp'))
+        assert_that(sniff_contenttype(getFile('image.gif')),
+                    is_('image/gif'))
+        assert_that(sniff_contenttype(b'plain text', 'text/plain'),
+                    is_('text/plain'))
+        assert_that(sniff_contenttype(b''), is_(None))
+
+        # containers are left to the type of the file name
+        docx = ('application/vnd.openxmlformats-officedocument.'
+                'wordprocessingml.document')
+        assert_that(sniff_contenttype(b'PK\x03\x04\x14\x00', docx),
+                    is_(docx))
+        assert_that(sniff_contenttype(b'PK\x03\x04\x14\x00',
+                                      'application/octet-stream'),
+                    is_('application/zip'))
+        assert_that(sniff_contenttype(getFile('notimage.doc'),
+                                      'application/msword'),
+                    is_('application/msword'))
+        assert_that(sniff_contenttype(b'\x00\x00\x00\x1cftypavif'),
+                    is_('image/avif'))
+        assert_that(sniff_contenttype(b'\x00\x00\x00\x18ftypheix',
+                                      'image/heic'),
+                    is_('image/heic'))
+        assert_that(sniff_contenttype(b'\x00\x00\x00\x18ftypcrx ',
+                                      'image/x-canon-cr3'),
+                    is_('image/x-canon-cr3'))
+        assert_that(sniff_contenttype(b'\x00\x00\x00\x18ftypcrx '),
+                    is_('video/mp4'))
+        assert_that(sniff_contenttype(b'II*\x00\x10\x00',
+                                      'image/x-canon-cr2'),
+                    is_('image/x-canon-cr2'))
+        assert_that(sniff_contenttype(b'II*\x00\x10\x00'),
+                    is_('image/tiff'))
+
     def test_ensure_data(self):
         assert_that(ensure_data(StringIO(u'data')),
                     is_(b'data'))
@@ -68,6 +183,34 @@ class TestUtils(unittest.TestCase):
         assert_that(process_jpeg(data),
                     is_(('image/jpeg', -1, -1)))
 
+    def test_jpeg_frames(self):
+        dht = b'\xff\xc4\x00\x04\x00\x00'
+        for marker in range(0xC0, 0xD0):
+            if marker in (0xC4, 0xC8, 0xCC):
+                continue
+            data = (b'\377\330\xff\xe0\x00\x04\xff\xff' + dht +
+                    b'\xff\xff' + struct.pack('>BBHBHH', 0xFF, marker,
+                                                 17, 8, 16, 32))
+            assert_that(process_jpeg(data),
+                        is_(('image/jpeg', 32, 16)))
+            assert_that(getImageInfo(BytesIO(data)),
+                        is_(('image/jpeg', 32, 16)))
+
+        # no frame before the start of scan
+        data = b'\377\330\xff\xd0\xff\xda\x00\x04\xff\xc0\x00\x11\x08'
+        assert_that(process_jpeg(data),
+                    is_(('image/jpeg', -1, -1)))
+        assert_that(getImageInfo(BytesIO(data)),
+                    is_(('image/jpeg', -1, -1)))
+
+        # truncated
+        for data in (b'\377\330\xff', b'\377\330\xff\xe0\x00',
+                     b'\377\330\xff\xc0\x00\x11'):
+            assert_that(process_jpeg(data),
+                        is_(('image/jpeg', -1, -1)))
+            assert_that(getImageInfo(BytesIO(data)),
+                        is_(('image/jpeg', -1, -1)))
+
     @fudge.patch('plone.namedfile.utils.tiff_utils._tiff_type')
     def test_invalid_tiff_type(self, mock_tt):
         mock_tt.is_callable().returns(-1)
@@ -88,6 +231,178 @@ class TestUtils(unittest.TestCase):
         assert_that(getImageInfo(b'xxxx'),
                     is_(('image/tiff', 10, 10)))
 
+    def test_get_image_info_stream(self):
+        for name in ('sample.gif', 'sample.png', 'sample.jpg',
+                     'sample.tiff', 'sample.bmp', 'notimage.doc'):
+            data = getFile(name)
+            fp = _CountingIO(data)
+            assert_that(getImageInfo(fp), is_(getImageInfo(data)))
+            assert_that(fp.tell(), is_(0))
+
+        assert_that(getImageInfo(BytesIO()), is_(('', -1, -1)))
+
+    def test_windowed_reader(self):
+        data = getFile('sample.jpg')
+        fp = _CountingIO(data)
+        reader = WindowedReader(fp)
+        assert_that(getImageInfo(reader), is_(('image/jpeg', 500, 200)))
+        assert_that(fp.reads, is_(1))
+        assert_that(reader.bytes_read, is_(1024))
+
+        # headers after large EXIF segments
+        segment = b'\xff\xe1' + struct.pack('>H', 0xFFFF) + b'\x00' * 0xFFFD
+        data = data[:2] + segment * 3 + data[2:]
+        fp = _CountingIO(data)
+        reader = WindowedReader(fp)
+        assert_that(getImageInfo(reader), is_(('image/jpeg', 500, 200)))
+        assert_that(fp.reads, is_(less_than(6)))
+        # the segments skipped over are not read
+        assert_that(fp.count, is_(less_than(8 * 1024)))
+
+        # rewinding to the previous window does not read it again
+        fp = _CountingIO(data)
+        reader = WindowedReader(fp)
+        reader.read(4)
+        reader.seek(0xFFFF * 2)
+        reader.read(4)
+        reader.seek(2)
+        assert_that(reader.read(4), is_(data[2:6]))
+        assert_that(fp.reads, is_(2))
+        reader.seek(0xFFFF * 2 + 2)
+        assert_that(reader.read(2), is_(data[0xFFFF * 2 + 2:0xFFFF * 2 + 4]))
+        assert_that(fp.reads, is_(2))
+
+        # reads are capped
+        reader = WindowedReader(BytesIO(data), limit=2048)
+        assert_that(getImageInfo(reader), is_(('image/jpeg', -1, -1)))
+        assert_that(reader.bytes_read, is_(2048))
+
+        reader = WindowedReader(BytesIO(b'0123456789'), window=4)
+        assert_that(reader.readable(), is_(True))
+        assert_that(reader.seekable(), is_(True))
+        assert_that(reader.read(2), is_(b'01'))
+        assert_that(reader.seek(2, 1), is_(4))
+        assert_that(reader.read(1), is_(b'4'))
+        with self.assertRaises(ValueError):
+            reader.seek(-6, 1)
+        reader.seek(-3, 2)
+        assert_that(reader.read(), is_(b'789'))
+        reader.seek(1)
+        assert_that(reader.read(3), is_(b'123'))
+        assert_that(reader.read(), is_(b'456789'))
+        assert_that(reader.read(), is_(b''))
+
+    def test_copy_stream(self):
+        from plone.namedfile.utils import io_utils
+        data = getFile('image.gif')
+        kernel_copy = io_utils._kernel_copy
+        self.addCleanup(setattr, io_utils, '_kernel_copy', kernel_copy)
+
+        def copy(source):
+            with tempfile.TemporaryFile() as target:
+                size = copy_stream(source, target)
+                target.seek(0)
+                return size, target.read()
+
+        with tempfile.TemporaryFile() as source:
+            source.write(data)
+
+            # copied through a buffer when the kernel cannot copy
+            def unsupported(*args):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            io_utils._kernel_copy = unsupported
+            source.seek(0)
+            assert_that(copy(source), is_((len(data), data)))
+
+            # with sendfile where copy_file_range is missing
+            io_utils._kernel_copy = kernel_copy
+            copy_file_range = getattr(os, 'copy_file_range', None)
+            if copy_file_range is not None and hasattr(os, 'sendfile'):
+                del os.copy_file_range
+                self.addCleanup(setattr, os, 'copy_file_range',
+                                copy_file_range)
+                source.seek(0)
+                assert_that(copy(source), is_((len(data), data)))
+                os.copy_file_range = copy_file_range
+
+            # but not after part of the data was copied
+            def partial(source_fd, target_fd, offset):
+                os.write(target_fd, data[:10])
+                raise OSError(errno.EIO, 'Input/output error')
+            io_utils._kernel_copy = partial
+            source.seek(0)
+            with self.assertRaises(OSError):
+                copy(source)
+
+        # pipes cannot tell their position
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, data)
+        os.close(write_fd)
+        with io.open(read_fd, 'rb') as source:
+            with tempfile.TemporaryFile() as target:
+                assert_that(copy_fd_stream(source, target), is_(none()))
+            assert_that(copy(source), is_((len(data), data)))
+
+        # streams without readinto
+        class Reader(object):
+
+            def __init__(self, data):
+                self.read = BytesIO(data).read
+
+        assert_that(copy(Reader(data)), is_((len(data), data)))
+
+        # old style files write everything and return None
+        class Writer(object):
+
+            def __init__(self):
+                self.data = BytesIO()
+
+            def write(self, b):
+                self.data.write(b)
+
+        target = Writer()
+        assert_that(copy_stream(BytesIO(data), target), is_(len(data)))
+        assert_that(target.data.getvalue(), is_(data))
+
+    def test_hashing_writer(self):
+        import hashlib
+        data = getFile('image.gif')
+
+        # old style files write everything and return None
+        class Writer(BytesIO):
+
+            def write(self, b):
+                BytesIO.write(self, b)
+
+        target = Writer()
+        writer = HashingWriter(target, hashlib.sha256(), 8)
+        assert_that(writer.writable(), is_(True))
+        assert_that(copy_stream(BytesIO(data), writer, 7), is_(len(data)))
+        assert_that(writer.header, is_(data[:8]))
+        assert_that(writer.digest.hexdigest(),
+                    is_(hashlib.sha256(data).hexdigest()))
+        writer.close()
+        assert_that(target.closed, is_(True))
+
+    def test_get_image_info_stream_bounded(self):
+        # big-endian TIFF with its IFD after the image data
+        data = (b'MM\x00\x2a' + struct.pack('>L', 8 + (1 << 20)) +
+                b'\x00' * (1 << 20) +
+                struct.pack('>H', 2) +
+                struct.pack('>HHLHH', 256, 3, 1, 640, 0) +
+                struct.pack('>HHLL', 257, 4, 1, 480))
+        fp = _CountingIO(data)
+        assert_that(getImageInfo(fp), is_(('image/tiff', 640, 480)))
+        assert_that(fp.count, is_(less_than(128)))
+
+        # JPEG with a large APP1 segment
+        data = getFile('sample.jpg')
+        data = (data[:2] + b'\xff\xe1' + struct.pack('>H', 0xFFFF) +
+                b'\x00' * (0xFFFF - 2) + data[2:])
+        fp = _CountingIO(data)
+        assert_that(getImageInfo(fp), is_(('image/jpeg', 500, 200)))
+        assert_that(fp.count, is_(less_than(1024)))
+
     def test_get_exif(self):
         assert_that(get_exif(getFile('sample.jpg')),
                     has_entries('0th', {},
@@ -95,6 +410,89 @@ class TestUtils(unittest.TestCase):
                                 'Exif', {},
                                 'GPS', {}))
 
+    def test_analyze_image(self):
+        data = getFile('exif.jpg')
+        info = analyze_image(data)
+        assert_that(info, has_properties('content_type', 'image/jpeg',
+                                         'width', 480,
+                                         'height', 360,
+                                         'orientation', 1))
+        assert_that(info.exif, is_(get_exif(data)))
+
+        info = analyze_image(BytesIO(data), exif=False)
+        assert_that(info, has_properties('content_type', 'image/jpeg',
+                                         'orientation', 1,
+                                         'exif', None))
+
+        info = analyze_image(getFile('image.gif'))
+        assert_that(info, is_(('image/gif', 200, 200, 1, None)))
+
+    def test_analyze_image_single_walk(self):
+        exif = {'0th': {piexif.ImageIFD.Orientation: 6}}
+        data = BytesIO()
+        piexif.insert(piexif.dump(exif), getFile('sample.jpg'), data)
+        data = data.getvalue()
+        # large segments before the EXIF and frame segments
+        segment = b'\xff\xe2' + struct.pack('>H', 0xFFFF) + b'\x00' * 0xFFFD
+        data = data[:2] + segment * 4 + data[2:]
+
+        fp = WindowedReader(BytesIO(data))
+        info = analyze_image(fp, exif=False)
+        assert_that(info, is_(('image/jpeg', 500, 200, 6, None)))
+        # the first window, then one read per segment skipped
+        assert_that(fp.reads, is_(5))
+        assert_that(fp.tell(), is_(0))
+
+        fp = WindowedReader(BytesIO(data))
+        assert_that(read_exif(fp)['0th'],
+                    has_entries({piexif.ImageIFD.Orientation: 6}))
+        assert_that(fp.reads, is_(5))
+
+        # truncated segments end the walk
+        info = analyze_image(BytesIO(b'\xff\xd8\xff\xe1\x00'), exif=False)
+        assert_that(info, is_(('image/jpeg', -1, -1, 1, None)))
+
+    def test_get_orientation(self):
+        assert_that(get_orientation(getFile('exif.jpg')), is_(1))
+        assert_that(get_orientation(getFile('sample.tiff')), is_(1))
+        assert_that(get_orientation(getFile('image.gif')), is_(1))
+
+        for orientation in range(1, 9):
+            exif = {'0th': {piexif.ImageIFD.Orientation: orientation}}
+            data = BytesIO()
+            piexif.insert(piexif.dump(exif), getFile('sample.jpg'), data)
+            data.seek(0)
+            assert_that(get_orientation(data), is_(orientation))
+            assert_that(data.tell(), is_(0))
+            assert_that(analyze_image(data, exif=False).orientation,
+                        is_(orientation))
+
+        # big-endian TIFF with a LONG orientation
+        data = (b'MM\x00\x2a' + struct.pack('>LH', 8, 1) +
+                struct.pack('>HHLL', 0x0112, 4, 1, 6))
+        assert_that(get_orientation(data), is_(6))
+        assert_that(get_orientation(data[:12]), is_(1))
+
+        # truncated JPEG segments
+        assert_that(get_orientation(b'\xff\xd8\xff\xe1\x00'), is_(1))
+
+        # EXIF segments without a TIFF header
+        data = b'\xff\xd8\xff\xe1\x00\x0cExif\x00\x00XXXX'
+        assert_that(get_orientation(data), is_(1))
+
+    def test_read_exif(self):
+        for name in ('exif.jpg', 'sample.jpg', 'sample.tiff'):
+            data = getFile(name)
+            fp = BytesIO(data)
+            assert_that(read_exif(fp), is_(get_exif(data)))
+            assert_that(fp.tell(), is_(0))
+        assert_that(read_exif(BytesIO(getFile('image.gif'))), is_(None))
+
+        summary = get_exif_summary(get_exif(getFile('exif.jpg')))
+        assert_that(summary, has_entries('0th',
+                                         has_entries(piexif.ImageIFD.Orientation, 1)))
+        assert_that(get_exif_summary(None), is_(None))
+
     @fudge.patch('plone.namedfile.utils.getImageInfo')
     def test_invalid_exif(self, mock_gi):
         mock_gi.is_callable().returns(('image/jpeg', 10, 10))
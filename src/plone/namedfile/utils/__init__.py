@@ -11,18 +11,50 @@ from __future__ import absolute_import
 import os
 import six
 import struct
-import mimetypes
 from io import BytesIO
+from collections import namedtuple
 
 import piexif
 
 from PIL import Image
 
+from plone.namedfile.utils.contenttype_utils import guess_contenttype
+from plone.namedfile.utils.contenttype_utils import warm_contenttypes  # pylint: disable=unused-import
+from plone.namedfile.utils.contenttype_utils import register_contenttype  # pylint: disable=unused-import
+
+from plone.namedfile.utils.magic_utils import sniff_contenttype  # pylint: disable=unused-import
+
+from plone.namedfile.utils.jpeg_utils import EXIF_HEADER
 from plone.namedfile.utils.jpeg_utils import process_jpeg
+from plone.namedfile.utils.jpeg_utils import read_jpeg_exif
+from plone.namedfile.utils.jpeg_utils import read_jpeg_info
+from plone.namedfile.utils.jpeg_utils import process_jpeg_file
 
 from plone.namedfile.utils.png_utils import process_png
 
 from plone.namedfile.utils.tiff_utils import process_tiff
+from plone.namedfile.utils.tiff_utils import read_tiff_tag
+from plone.namedfile.utils.tiff_utils import process_tiff_file
+
+#: Number of bytes needed to identify an image and, except for JPEG and
+#: TIFF images, to find out its dimensions
+IMAGE_HEADER_BYTES = 32
+
+#: Only these two image types could have EXIF information,
+#: see http://www.cipa.jp/std/documents/e/DC-008-2012_E.pdf
+EXIF_CONTENT_TYPES = ('image/jpeg', 'image/tiff')
+
+#: The EXIF tags kept by `get_exif_summary`
+EXIF_SUMMARY_TAGS = (
+    piexif.ImageIFD.Orientation,
+    piexif.ImageIFD.XResolution,
+    piexif.ImageIFD.YResolution,
+    piexif.ImageIFD.ResolutionUnit,
+)
+
+#: The result of `analyze_image`
+ImageAnalysis = namedtuple('ImageAnalysis',
+                           'content_type width height orientation exif')
 
 logger = __import__('logging').getLogger(__name__)
 
@@ -51,7 +83,7 @@ def get_contenttype(source=None,
         return file_type
     filename = getattr(source, 'filename', filename)
     if filename:
-        return mimetypes.guess_type(filename, strict=True)[0] or 'application/octet-stream'
+        return guess_contenttype(filename) or 'application/octet-stream'
     return default
 
 
@@ -79,10 +111,9 @@ def ensure_data(image):
 _ensure_data = ensure_data
 
 
-def getImageInfo(data):
+def _getImageInfo(data):
     content_type = None
     width, height = -1, -1
-    data = ensure_data(data)
     size = len(data)
     # handle GIFs
     if size >= 10 and data[:6] in (b'GIF87a', b'GIF89a'):
@@ -106,14 +137,60 @@ def getImageInfo(data):
         content_type, width, height = process_tiff(data)
     # Use PIL / Pillow to determ Image Information
     elif data:
-        try:
-            img = Image.open(BytesIO(data))
-            width, height = img.size
-            content_type = img.format or ''
-            if content_type.lower() == 'tiff':
-                content_type = 'image/tiff'
-        except Exception as e:  # pylint:disable=broad-except
-            logger.exception(e)
+        content_type, width, height = _getPILImageInfo(BytesIO(data))
+    return content_type, width, height
+
+
+def _getPILImageInfo(fp):
+    content_type = None
+    width, height = -1, -1
+    try:
+        img = Image.open(fp)
+        width, height = img.size
+        content_type = img.format or ''
+        if content_type.lower() == 'tiff':
+            content_type = 'image/tiff'
+    except Exception as e:  # pylint:disable=broad-except
+        logger.exception(e)
+    return content_type, width, height
+
+
+def _getStreamImageInfo(fp):
+    """
+    Return the image info of a file object reading only the headers
+    needed to find out the dimensions.
+    """
+    start = fp.tell()
+    try:
+        header = bytes_(fp.read(IMAGE_HEADER_BYTES))
+        if header[:2] == b'\377\330':
+            fp.seek(start)
+            return process_jpeg_file(fp)
+        if len(header) >= 8 and header[:4] in (b"II\052\000", b"MM\000\052"):
+            fp.seek(start)
+            return process_tiff_file(fp)
+        if     header[:6] in (b'GIF87a', b'GIF89a') \
+            or header[:8] == b'\211PNG\r\n\032\n' \
+            or header[:2] == b'BM' \
+            or not header:
+            return _getImageInfo(header)
+        # Let PIL / Pillow read what it needs
+        fp.seek(start)
+        return _getPILImageInfo(fp)
+    finally:
+        fp.seek(start)
+
+
+def getImageInfo(data):
+    """
+    Return the content type and dimensions of an image.
+
+    File objects are not read in full, only the image headers are.
+    """
+    if getattr(data, 'read', None) is not None:
+        content_type, width, height = _getStreamImageInfo(data)
+    else:
+        content_type, width, height = _getImageInfo(ensure_data(data))
     # return
     logger.debug('Image Info (Type: %s, Width: %s, Height: %s)',
                  content_type, width, height)
@@ -122,28 +199,148 @@ def getImageInfo(data):
     return content_type, width, height
 
 
+def _load_exif(image_data, width, height):
+    try:
+        exif_data = piexif.load(image_data)
+    except Exception as e:  # pylint:disable=broad-except
+        # We need to determine wich error really happens
+        # Should happen if data is to short --> first_bytes
+        logger.warning(e)
+        exif_data = {
+            '0th': {
+                piexif.ImageIFD.XResolution: (width, 1),
+                piexif.ImageIFD.YResolution: (height, 1),
+            }
+        }
+    return exif_data
+
+
 def get_exif(image):
     exif_data = None
     image_data = ensure_data(image)
     content_type, width, height = getImageInfo(image_data)
-    if content_type in ('image/jpeg', 'image/tiff'):
-        # Only this two Image Types could have Exif informations
-        # see http://www.cipa.jp/std/documents/e/DC-008-2012_E.pdf
-        try:
-            exif_data = piexif.load(image_data)
-        except Exception as e:  # pylint:disable=broad-except
-            # We need to determine wich error really happens
-            # Should happen if data is to short --> first_bytes
-            logger.warning(e)
-            exif_data = exif_data = {
-                '0th': {
-                    piexif.ImageIFD.XResolution: (width, 1),
-                    piexif.ImageIFD.YResolution: (height, 1),
-                }
-            }
+    if content_type in EXIF_CONTENT_TYPES:
+        exif_data = _load_exif(image_data, width, height)
     return exif_data
 
 
+def _empty_exif():
+    return {'0th': {}, 'Exif': {}, 'GPS': {}, 'Interop': {}, '1st': {},
+            'thumbnail': None}
+
+
+def _is_jpeg(fp):
+    start = fp.tell()
+    try:
+        return bytes_(fp.read(2)) == b'\377\330'
+    finally:
+        fp.seek(start)
+
+
+def _segment_orientation(segment):
+    """
+    Return the orientation in the data of an EXIF segment, 1 if none
+    """
+    orientation = None
+    if segment is not None:
+        tiff = BytesIO(segment[len(EXIF_HEADER):])
+        orientation = read_tiff_tag(tiff, piexif.ImageIFD.Orientation)
+    return orientation if 1 <= (orientation or 0) <= 8 else 1
+
+
+def read_exif(fp):
+    """
+    Return the EXIF data of an image file object.
+
+    Only the EXIF segment of JPEG images is read, TIFF images are read in
+    full as their EXIF data may be anywhere in the file.
+    """
+    start = fp.tell()
+    try:
+        exif_data = None
+        if _is_jpeg(fp):
+            # the dimensions and the segment in a single walk
+            _, width, height, segment = read_jpeg_info(fp)
+            if segment is None:
+                exif_data = _empty_exif()
+            else:
+                exif_data = _load_exif(segment, width, height)
+        else:
+            content_type, width, height = getImageInfo(fp)
+            if content_type in EXIF_CONTENT_TYPES:
+                exif_data = _load_exif(bytes_(fp.read()), width, height)
+        return exif_data
+    finally:
+        fp.seek(start)
+
+
+def get_exif_summary(exif_data):
+    """
+    Return a copy of EXIF data holding only the `EXIF_SUMMARY_TAGS`
+    """
+    if exif_data is None:
+        return None
+    ifd = exif_data.get('0th') or {}
+    return {
+        '0th': dict((tag, ifd[tag]) for tag in EXIF_SUMMARY_TAGS if tag in ifd)
+    }
+
+
+def get_orientation(image):
+    """
+    Return the EXIF orientation of an image, 1 if it has none.
+
+    Only the orientation tag is read, from the EXIF segment of JPEG images
+    or the first IFD of TIFF images, the EXIF data is not parsed.
+    """
+    fp = image
+    if getattr(image, 'read', None) is None:
+        fp = BytesIO(ensure_data(image))
+    start = fp.tell()
+    try:
+        orientation = None
+        header = bytes_(fp.read(4))
+        fp.seek(start)
+        if header[:2] == b'\377\330':
+            orientation = _segment_orientation(read_jpeg_exif(fp))
+        elif header in (b"II\052\000", b"MM\000\052"):
+            orientation = read_tiff_tag(fp, piexif.ImageIFD.Orientation)
+        return orientation if 1 <= (orientation or 0) <= 8 else 1
+    finally:
+        fp.seek(start)
+
+
+def analyze_image(image, exif=True):
+    """
+    Return the content type, dimensions, orientation and EXIF data of an
+    image in a single pass.
+
+    The segments of JPEG files are walked once for the dimensions and the
+    orientation. The EXIF data is only parsed if ``exif`` is true, file
+    objects are only read in full in that case.
+    """
+    exif_data, orientation = None, None
+    if getattr(image, 'read', None) is None:
+        image = ensure_data(image)
+        content_type, width, height = getImageInfo(image)
+    elif _is_jpeg(image):
+        start = image.tell()
+        try:
+            content_type, width, height, segment = read_jpeg_info(image)
+        finally:
+            image.seek(start)
+        orientation = _segment_orientation(segment)
+    else:
+        content_type, width, height = getImageInfo(image)
+    if content_type in EXIF_CONTENT_TYPES:
+        if orientation is None:
+            orientation = get_orientation(image)
+        if exif:
+            exif_data = _load_exif(ensure_data(image), width, height)
+    return ImageAnalysis(content_type, width, height, orientation or 1,
+                         exif_data)
+
+
 def load_exif(img):
     return piexif.load(img.info['exif'])
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content types of file names, looked up by extension in a table built once
+from the `mimetypes` database.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import mimetypes
+import threading
+from collections import OrderedDict
+
+#: The most file names remembered among those whose content type is not
+#: looked up by extension, such as compressed archives
+CONTENTTYPE_CACHE_SIZE = 4096
+
+#: The content types by extension, built by `warm_contenttypes`
+_extension_types = None
+
+#: The extensions handled by `mimetypes` from the whole file name
+_compound_extensions = frozenset()
+
+#: The content types registered with `register_contenttype`
+_overrides = {}
+
+#: The content types of the file names guessed by `mimetypes`, least
+#: recently used first
+_guessed = OrderedDict()
+_guessed_lock = threading.Lock()
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def warm_contenttypes():
+    """
+    Load the `mimetypes` database and build the table of the content
+    types by extension.
+
+    Call it before forking workers for them to share the table, it is
+    otherwise built on the first lookup.
+    """
+    global _extension_types, _compound_extensions  # pylint: disable=global-statement
+    if not mimetypes.inited:
+        mimetypes.init()
+    _compound_extensions = frozenset(list(mimetypes.suffix_map) +
+                                     list(mimetypes.encodings_map))
+    _extension_types = dict(mimetypes.types_map)
+    with _guessed_lock:
+        _guessed.clear()
+
+
+def register_contenttype(extension, content_type):
+    """
+    Use ``content_type`` for the file names with ``extension``, whatever
+    the `mimetypes` database says. None removes the override.
+    """
+    extension = extension.lower()
+    if not extension.startswith('.'):
+        extension = '.' + extension
+    if content_type is None:
+        _overrides.pop(extension, None)
+    else:
+        _overrides[extension] = content_type
+
+
+def _guess_type(filename):
+    with _guessed_lock:
+        try:
+            content_type = _guessed.pop(filename)
+        except KeyError:
+            content_type = mimetypes.guess_type(filename, strict=True)[0]
+            if len(_guessed) >= CONTENTTYPE_CACHE_SIZE:
+                _guessed.popitem(last=False)
+        _guessed[filename] = content_type
+        return content_type
+
+
+def guess_contenttype(filename):
+    """
+    Return the content type of a file name, None if it is not known.
+
+    The same as `mimetypes.guess_type` except for registered overrides.
+    """
+    if _extension_types is None:
+        warm_contenttypes()
+    path = filename
+    # URL schemes are stripped like urllib does
+    colon = path.find(':')
+    if colon > 0 and '/' not in path[:colon]:
+        if path[:colon].lower() == 'data':
+            return _guess_type(filename)
+        path = path[colon + 1:]
+    # the extension as posixpath.splitext finds it
+    name = path[path.rfind('/') + 1:]
+    dot = name.rfind('.')
+    if dot <= 0 or not name[:dot].lstrip('.'):
+        return None
+    ext = name[dot:]
+    lower = ext.lower()
+    content_type = _overrides.get(lower)
+    if content_type is not None:
+        return content_type
+    if ext in _compound_extensions or lower in _compound_extensions:
+        # the type of compressed files comes from their inner extension,
+        # any name with the same extensions has the same type
+        inner = name.rfind('.', 0, dot)
+        if inner == -1:
+            return _guess_type('x' + ext)
+        if      inner > 0 and name[:inner].lstrip('.') \
+            and ':' not in name[inner:]:
+            return _guess_type('x' + name[inner:])
+        return _guess_type(filename)
+    return _extension_types.get(ext) or _extension_types.get(lower)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Helpers to copy streams into blob files.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import io
+import os
+
+#: The size of the buffer used to copy streams through Python
+COPY_BUFFER_SIZE = 1 << 20
+
+#: The maximum number of bytes asked to the kernel per system call
+KERNEL_COPY_SIZE = 1 << 30
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def fileno(fp):
+    """
+    Return the file descriptor of a stream or None if it has none
+    """
+    try:
+        return fp.fileno()
+    except (AttributeError, ValueError, EnvironmentError,
+            io.UnsupportedOperation):
+        return None
+
+
+def _kernel_copy(source_fd, target_fd, offset):
+    """
+    Copy everything after ``offset`` in ``source_fd`` to the current
+    position of ``target_fd`` without passing through user space.
+    """
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    size = 0
+    while True:
+        if copy_file_range is not None:
+            copied = copy_file_range(source_fd, target_fd,
+                                     KERNEL_COPY_SIZE, offset + size)
+        else:
+            copied = os.sendfile(target_fd, source_fd,
+                                 offset + size, KERNEL_COPY_SIZE)
+        if not copied:
+            return size
+        size += copied
+
+
+def copy_fd_stream(source, target):
+    """
+    Copy the rest of ``source`` to ``target`` with ``copy_file_range`` or
+    ``sendfile`` when both are backed by regular files.
+
+    Return the number of bytes copied, or None if the kernel cannot copy
+    between these streams and nothing was written.
+    """
+    source_fd, target_fd = fileno(source), fileno(target)
+    if      source_fd is None or target_fd is None \
+        or (    not hasattr(os, 'copy_file_range')
+            and not hasattr(os, 'sendfile')):
+        return None
+    try:
+        # the logical position, buffered readers may have read ahead
+        offset = source.tell()
+        target.flush()
+        target_offset = os.lseek(target_fd, 0, os.SEEK_CUR)
+    except (EnvironmentError, io.UnsupportedOperation):
+        return None
+    try:
+        size = _kernel_copy(source_fd, target_fd, offset)
+    except EnvironmentError as e:
+        if os.lseek(target_fd, 0, os.SEEK_CUR) != target_offset:
+            # failed after writing part of the data
+            raise
+        # not supported between these files (pipes, old kernels,
+        # different file systems), fall back to a buffered copy
+        logger.debug('Cannot copy in kernel: %s', e)
+        return None
+    source.seek(offset + size)
+    return size
+
+
+def _write(target, data):
+    # raw files, like blob files, may write less than asked
+    view = memoryview(data)
+    while view:
+        written = target.write(view)
+        if written is None:
+            return
+        view = view[written:]
+
+
+def copy_stream(source, target, buffer_size=COPY_BUFFER_SIZE):
+    """
+    Copy the rest of ``source`` to ``target`` in chunks of ``buffer_size``
+    and return the number of bytes written.
+
+    Text streams are encoded as UTF-8.
+    """
+    if isinstance(source, io.TextIOBase):
+        size = 0
+        for chunk in iter(lambda: source.read(buffer_size), u''):
+            chunk = chunk.encode('utf-8')
+            _write(target, chunk)
+            size += len(chunk)
+        return size
+
+    size = copy_fd_stream(source, target)
+    if size is not None:
+        return size
+
+    size = 0
+    readinto = getattr(source, 'readinto', None)
+    if readinto is None:
+        for chunk in iter(lambda: source.read(buffer_size), b''):
+            _write(target, chunk)
+            size += len(chunk)
+        return size
+
+    # reuse a single preallocated buffer
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    while True:
+        count = readinto(buf)
+        if not count:
+            return size
+        _write(target, view[:count])
+        size += count
+
+
+def copy_file(source, target, buffer_size=COPY_BUFFER_SIZE):
+    """
+    Copy the file named ``source`` to a new file named ``target`` and
+    return the number of bytes copied.
+    """
+    with open(source, 'rb') as fsrc:
+        with open(target, 'wb') as fdst:
+            return copy_stream(fsrc, fdst, buffer_size)
+
+
+def unshare_file(path, keep=True):
+    """
+    Give ``path`` an inode of its own if it is a hard link shared with
+    other paths, by copying its data if ``keep`` is true or else removing
+    it.
+
+    Return whether the file was shared.
+    """
+    if not path or os.stat(path).st_nlink < 2:
+        return False
+    if keep:
+        temp = path + '.unshared'
+        copy_file(path, temp)
+        os.rename(temp, path)
+    else:
+        os.remove(path)
+    return True
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    A write only file object passing the data written to an underlying
+    file through a hash, and keeping its first ``header_size`` bytes.
+
+    It has no file descriptor, so copies into it are not made in the
+    kernel where the hash would not see the data.
+    """
+
+    def __init__(self, fp, digest, header_size=0):
+        super(HashingWriter, self).__init__()
+        self._fp = fp
+        self.digest = digest
+        self.header_size = header_size
+        self.header = b''
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        written = self._fp.write(b)
+        if written is None:
+            written = len(b)
+        data = memoryview(b)[:written]
+        self.digest.update(data)
+        if len(self.header) < self.header_size:
+            self.header += data[:self.header_size - len(self.header)].tobytes()
+        return written
+
+    def flush(self):
+        self._fp.flush()
+
+    def close(self):
+        if not self.closed:
+            try:
+                super(HashingWriter, self).close()
+            finally:
+                self._fp.close()
+
+
+class WindowedReader(io.RawIOBase):
+    """
+    A read only file object serving the reads of header parsers from
+    windows of an underlying file.
+
+    Reads going on past the current window load a new one, each larger
+    than the previous one, so the common case is a single small read of
+    the file while long headers are still read in few calls. Reads after
+    a seek elsewhere only load what they ask for, rounded up to the
+    first window size, so skipping over large segments does not read
+    them. The previous window is kept for parsers seeking back to it.
+    No more than ``limit`` bytes are read from the file, beyond it the
+    file looks exhausted.
+    """
+
+    #: How much larger each window is than the previous one
+    growth = 8
+
+    def __init__(self, fp, window=1 << 10, max_window=1 << 16,
+                 limit=1 << 24):
+        super(WindowedReader, self).__init__()
+        self._fp = fp
+        self._min_window = self._window = window
+        self._max_window = max_window
+        self._limit = limit
+        self._pos = fp.tell()
+        #: The loaded (start, data) windows, the current one first
+        self._windows = []
+        self._eof = None
+        #: The number of reads and bytes read from the file
+        self.reads = self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            self._fp.seek(0, 2)
+            offset += self._fp.tell()
+        if offset < 0:
+            raise ValueError("negative seek position %r" % offset)
+        self._pos = offset
+        return offset
+
+    def _find(self, size):
+        """
+        Return the loaded window serving a read of ``size`` bytes at the
+        current position, making it the current one, or None.
+        """
+        for window in self._windows:
+            start, data = window
+            end = start + len(data)
+            if start <= self._pos and (self._pos + size <= end or
+                                       end == self._eof):
+                if window is not self._windows[0]:
+                    self._windows.reverse()
+                return window
+        return None
+
+    def _load(self, size):
+        """
+        Load a window serving a read of ``size`` bytes at the current
+        position and return it.
+        """
+        if self._windows:
+            start, data = self._windows[0]
+            sequential = start <= self._pos <= start + len(data)
+        else:
+            sequential = True
+        if sequential:
+            # reading on, larger windows
+            size = max(size, self._window)
+            self._window = min(self._window * self.growth, self._max_window)
+        else:
+            size = max(size, self._min_window)
+        size = min(size, self._limit - self.bytes_read)
+        self._fp.seek(self._pos)
+        data = self._fp.read(size) if size > 0 else b''
+        self.reads += 1
+        self.bytes_read += len(data)
+        if len(data) < size or size <= 0:
+            self._eof = self._pos + len(data)
+        window = (self._pos, data)
+        self._windows = [window] + self._windows[:1]
+        return window
+
+    def readinto(self, b):
+        size = len(b)
+        if self._eof is not None and self._pos >= self._eof:
+            return 0
+        start, data = self._find(size) or self._load(size)
+        offset = self._pos - start
+        data = data[offset:offset + size]
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
@@ -9,38 +9,156 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import struct
-from io import BytesIO
+
+from six import indexbytes
+
+#: Start Of Frame markers, their segment holds the image dimensions.
+#: 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) are not frames
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - frozenset((0xC4, 0xC8, 0xCC))
+
+#: Markers that are not followed by a segment length
+STANDALONE_MARKERS = frozenset([0x00, 0x01] + list(range(0xD0, 0xD9)))
+
+#: Start Of Scan and End Of Image markers, no frame header follows them
+END_MARKERS = frozenset((0xDA, 0xD9))
+
+#: The header of the APP1 segment holding the EXIF data
+EXIF_HEADER = b'Exif\x00\x00'
 
 logger = __import__('logging').getLogger(__name__)
 
 
+def _scan_jpeg(data):
+    """
+    Return the dimensions of a JPEG image jumping from segment to segment.
+    """
+    size = len(data)
+    offset = 2
+    while True:
+        offset = data.find(b'\xff', offset)
+        if offset == -1:
+            break
+        # skip fill bytes
+        while offset < size and indexbytes(data, offset) == 0xFF:
+            offset += 1
+        if offset >= size:
+            break
+        marker = indexbytes(data, offset)
+        offset += 1
+        if marker in END_MARKERS:
+            break
+        if marker in SOF_MARKERS:
+            if offset + 7 > size:
+                break
+            height, width = struct.unpack_from(b'>HH', data, offset + 3)
+            return int(width), int(height)
+        if marker not in STANDALONE_MARKERS:
+            if offset + 2 > size:
+                break
+            offset += struct.unpack_from(b'>H', data, offset)[0]
+    return -1, -1
+
+
 def process_jpeg(data):
     size = len(data)
     content_type, width, height = None, -1, -1
     # handle JPEGs
     if size >= 2 and data.startswith(b'\377\330'):
         content_type = 'image/jpeg'
-        jpeg = BytesIO(data)
-        jpeg.read(2)
+        width, height = _scan_jpeg(data)
+    # return
+    return content_type, width, height
+
+
+def _iter_jpeg_segments(jpeg):
+    """
+    Iterate over the marker and data length of the segments of a JPEG file
+    up to its first scan.
+
+    The file must be positioned after the SOI marker. It is positioned at
+    the start of the segment data when a segment is yielded, the data not
+    read by the consumer is skipped by seeking over it.
+    """
+    b = jpeg.read(1)
+    while b:
+        while b and b != b'\xff':
+            b = jpeg.read(1)
+        while b == b'\xff':
+            b = jpeg.read(1)
+        if not b or ord(b) in END_MARKERS:
+            break
+        marker = ord(b)
+        if marker not in STANDALONE_MARKERS:
+            length = struct.unpack(b'>H', jpeg.read(2))[0] - 2
+            end = jpeg.tell() + length
+            yield marker, length
+            jpeg.seek(end)
         b = jpeg.read(1)
+
+
+def process_jpeg_file(jpeg):
+    """
+    Return the content type and dimensions of a JPEG file.
+
+    Only the segment markers are read, the segment data is skipped by
+    seeking over it.
+    """
+    content_type, width, height = None, -1, -1
+    if jpeg.read(2) == b'\377\330':
+        content_type = 'image/jpeg'
         try:
-            width = -1
-            width = -1
-            while b and ord(b) != 0xDA:
-                while ord(b) != 0xFF:
-                    b = jpeg.read(1)
-                while ord(b) == 0xFF:
-                    b = jpeg.read(1)
-                if ord(b) >= 0xC0 and ord(b) <= 0xC3:
-                    jpeg.read(3)
-                    height, width = struct.unpack(b'>HH', jpeg.read(4))
+            for marker, _ in _iter_jpeg_segments(jpeg):
+                if marker in SOF_MARKERS:
+                    height, width = struct.unpack(b'>xHH', jpeg.read(5))
                     break
-                else:
-                    jpeg.read(int(struct.unpack(b'>H', jpeg.read(2))[0]) - 2)
-                b = jpeg.read(1)
             width = int(width)
             height = int(height)
         except (struct.error, ValueError, TypeError):
             pass
     # return
     return content_type, width, height
+
+
+def read_jpeg_info(jpeg):
+    """
+    Return the content type, dimensions and EXIF (APP1) segment data of a
+    JPEG file in a single walk over its segments.
+
+    The walk stops once both the frame header and the EXIF segment are
+    found, no other segment data is read.
+    """
+    content_type, width, height, exif = None, -1, -1, None
+    if jpeg.read(2) == b'\377\330':
+        content_type = 'image/jpeg'
+        try:
+            for marker, length in _iter_jpeg_segments(jpeg):
+                if marker in SOF_MARKERS and height == -1:
+                    height, width = struct.unpack(b'>xHH', jpeg.read(5))
+                elif marker == 0xE1 and exif is None:
+                    data = jpeg.read(length)
+                    if data.startswith(EXIF_HEADER):
+                        exif = data
+                if height != -1 and exif is not None:
+                    break
+        except (struct.error, ValueError, TypeError):
+            pass
+    return content_type, int(width), int(height), exif
+
+
+def read_jpeg_exif(jpeg):
+    """
+    Return the data of the EXIF (APP1) segment of a JPEG file, starting
+    with its ``Exif`` header, or ``None``.
+
+    No other segment data is read.
+    """
+    if jpeg.read(2) == b'\377\330':
+        try:
+            for marker, length in _iter_jpeg_segments(jpeg):
+                if marker == 0xE1:
+                    data = jpeg.read(length)
+                    if data.startswith(EXIF_HEADER):
+                        return data
+        except (struct.error, ValueError, TypeError):
+            pass
+    return None
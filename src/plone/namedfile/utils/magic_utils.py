@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content types of file data recognized by their first bytes.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+#: The number of first bytes `sniff_contenttype` looks at
+MAGIC_BYTES = 64
+
+#: The content types recognized by the bytes found at given offsets, the
+#: first matching entry wins
+MAGIC_NUMBERS = (
+    (((0, b'%!PS'),), 'application/postscript'),
+    (((0, b'{\\rtf'),), 'application/rtf'),
+    (((0, b'7z\xbc\xaf\x27\x1c'),), 'application/x-7z-compressed'),
+    (((0, b'Rar!\x1a\x07'),), 'application/x-rar-compressed'),
+    (((0, b'GIF87a'),), 'image/gif'),
+    (((0, b'GIF89a'),), 'image/gif'),
+    (((0, b'\x89PNG\r\n\x1a\n'),), 'image/png'),
+    (((0, b'\xff\xd8\xff'),), 'image/jpeg'),
+    (((0, b'RIFF'), (8, b'WEBP')), 'image/webp'),
+    (((0, b'RIFF'), (8, b'WAVE')), 'audio/x-wav'),
+    (((0, b'RIFF'), (8, b'AVI ')), 'video/x-msvideo'),
+    # ISO base media files by their major brand
+    (((4, b'ftypqt  '),), 'video/quicktime'),
+    (((4, b'ftypM4A '),), 'audio/mp4'),
+    (((4, b'ftypavif'),), 'image/avif'),
+    (((4, b'ftypavis'),), 'image/avif'),
+    (((4, b'ftypheic'),), 'image/heic'),
+    (((4, b'ftypheix'),), 'image/heic'),
+    (((4, b'ftyphevc'),), 'image/heic-sequence'),
+    (((4, b'ftyphevx'),), 'image/heic-sequence'),
+    (((4, b'ftypmif1'),), 'image/heif'),
+    (((4, b'ftypmsf1'),), 'image/heif-sequence'),
+    (((4, b'ftypisom'),), 'video/mp4'),
+    (((4, b'ftypiso2'),), 'video/mp4'),
+    (((4, b'ftypmp41'),), 'video/mp4'),
+    (((4, b'ftypmp42'),), 'video/mp4'),
+    (((4, b'ftypavc1'),), 'video/mp4'),
+    (((4, b'ftypdash'),), 'video/mp4'),
+    (((0, b'fLaC'),), 'audio/flac'),
+    (((0, b'ID3'),), 'audio/mpeg'),
+    (((0, b'\xff\xfb'),), 'audio/mpeg'),
+    (((0, b'\xff\xf3'),), 'audio/mpeg'),
+    (((0, b'\xff\xf2'),), 'audio/mpeg'),
+    (((0, b'wOFF'),), 'font/woff'),
+    (((0, b'wOF2'),), 'font/woff2'),
+)
+
+#: The content types of formats other formats are built on, such as
+#: OOXML documents on ZIP, Word documents on OLE, camera raw images on
+#: TIFF or Illustrator files on PDF, matched after `MAGIC_NUMBERS` and
+#: left to the file name when it has a type
+CONTAINER_MAGIC_NUMBERS = (
+    (((0, b'%PDF-'),), 'application/pdf'),
+    (((0, b'PK\x03\x04'),), 'application/zip'),
+    (((0, b'PK\x05\x06'),), 'application/zip'),
+    (((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),), 'application/x-ole-storage'),
+    (((0, b'\x1f\x8b'),), 'application/gzip'),
+    (((0, b'BZh'),), 'application/x-bzip2'),
+    (((0, b'\xfd7zXZ\x00'),), 'application/x-xz'),
+    (((0, b'II*\x00'),), 'image/tiff'),
+    (((0, b'MM\x00*'),), 'image/tiff'),
+    # other brands of ISO base media files, or audio as well as video
+    (((4, b'ftyp3g'),), 'video/3gpp'),
+    (((4, b'ftyp'),), 'video/mp4'),
+    (((0, b'\x1aE\xdf\xa3'),), 'video/x-matroska'),
+    (((0, b'OggS'),), 'application/ogg'),
+)
+
+#: Content types telling nothing about the data
+UNKNOWN_TYPES = (None, '', b'', 'application/octet-stream',
+                 b'application/octet-stream')
+
+
+def _match(header, magic_numbers):
+    for magic, content_type in magic_numbers:
+        for offset, value in magic:
+            if not header.startswith(value, offset):
+                break
+        else:
+            return content_type
+    return None
+
+
+def sniff_contenttype(header, default=None):
+    """
+    Return the content type of the data starting with the ``header``
+    bytes, or ``default`` when it is not recognized.
+
+    ``default`` is also returned, when it is known, for data in a
+    container format.
+    """
+    header = header or b''
+    content_type = _match(header, MAGIC_NUMBERS)
+    if content_type is not None:
+        return content_type
+    if default not in UNKNOWN_TYPES:
+        return default
+    content_type = _match(header, CONTAINER_MAGIC_NUMBERS)
+    if content_type == 'video/x-matroska' and b'webm' in header:
+        content_type = 'video/webm'
+    return default if content_type is None else content_type
@@ -15,13 +15,25 @@ logger = __import__('logging').getLogger(__name__)
 
 
 def process_tiff(data):
+    return process_tiff_file(BytesIO(data))
+
+
+def process_tiff_file(tiff):
+    """
+    Return the content type and dimensions of a TIFF file.
+
+    Only the header and the first IFD are read, the file is expected to be
+    positioned at the start of the image.
+    """
     content_type = None
     width = height = -1
     # Standard TIFF, big- or little-endian
     # BigTIFF and other different but TIFF-like formats are not
     # supported currently
-    byte_order = data[:2]
-    bo_char = ">" if byte_order == "MM" else "<"
+    start = tiff.tell()
+    header = tiff.read(8)
+    byte_order = header[:2]
+    bo_char = ">" if byte_order == b"MM" else "<"
     # maps TIFF type id to size (in bytes)
     # and python format char for struct
     tiff_types = {
@@ -38,33 +50,28 @@ def process_tiff(data):
         11: (4, bo_char + "f"),  # FLOAT
         12: (8, bo_char + "d")   # DOUBLE
     }
-    tiff = BytesIO(data)
-    ifd_offset = struct.unpack(bo_char + "L", data[4:8])[0]
     try:
-        count_size = 2
-        tiff.seek(ifd_offset)
-        ec = tiff.read(count_size)
+        ifd_offset = struct.unpack(bo_char + "L", header[4:8])[0]
+        tiff.seek(start + ifd_offset)
+        ec = tiff.read(2)
         ifd_entry_count = struct.unpack(bo_char + "H", ec)[0]
         # 2 bytes: TagId + 2 bytes: type + 4 bytes: count of values + 4
         # bytes: value offset
         ifd_entry_size = 12
+        entries = tiff.read(ifd_entry_count * ifd_entry_size)
         for i in range(ifd_entry_count):
-            entry_offset = ifd_offset + count_size + i * ifd_entry_size
-            tiff.seek(entry_offset)
-            tag = tiff.read(2)
-            tag = struct.unpack(bo_char + "H", tag)[0]
+            entry = entries[i * ifd_entry_size:(i + 1) * ifd_entry_size]
+            tag = struct.unpack(bo_char + "H", entry[:2])[0]
             if tag in (256, 257):
                 # if type indicates that value fits into 4 bytes, value
                 # offset is not an offset but value itself
-                type_ = tiff.read(2)
-                type_ = _tiff_type(bo_char, type_)
+                type_ = _tiff_type(bo_char, entry[2:4])
                 if type_ not in tiff_types:
                     raise Exception("Unkown TIFF field type:" +
                                     str(type_))
                 type_size = tiff_types[type_][0]
                 type_char = tiff_types[type_][1]
-                tiff.seek(entry_offset + 8)
-                value = tiff.read(type_size)
+                value = entry[8:8 + type_size]
                 value = int(struct.unpack(type_char, value)[0])
                 if tag == 256:
                     width = value
@@ -81,3 +88,33 @@ def process_tiff(data):
 
 def _tiff_type(bo_char, type_):
     return struct.unpack(bo_char + "H", type_)[0]
+
+
+def read_tiff_tag(tiff, tag):
+    """
+    Return the value of a SHORT or LONG tag of the first IFD of a TIFF
+    file, or ``None``.
+
+    The file must be positioned at the start of the TIFF header, only the
+    header and the first IFD are read.
+    """
+    start = tiff.tell()
+    header = tiff.read(8)
+    if header[:2] not in (b"II", b"MM"):
+        return None
+    bo_char = ">" if header[:2] == b"MM" else "<"
+    try:
+        ifd_offset = struct.unpack(bo_char + "L", header[4:8])[0]
+        tiff.seek(start + ifd_offset)
+        ifd_entry_count = struct.unpack(bo_char + "H", tiff.read(2))[0]
+        entries = tiff.read(ifd_entry_count * 12)
+        for i in range(ifd_entry_count):
+            entry = entries[i * 12:(i + 1) * 12]
+            tag_, type_ = struct.unpack(bo_char + "HH", entry[:4])
+            if tag_ == tag and type_ == 3:  # SHORT
+                return struct.unpack(bo_char + "H", entry[8:10])[0]
+            elif tag_ == tag and type_ == 4:  # LONG
+                return struct.unpack(bo_char + "L", entry[8:12])[0]
+    except struct.error:
+        pass
+    return None